@@ -43,6 +43,14 @@ import os
 import numpy as np
 import pandas as pd
 
+# optional JIT compiler for the per-cell kernels
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    numba = None
+    HAS_NUMBA = False
+
 
 def drop_center_cell(vct_window_rows, vct_window_cols):
     """
@@ -115,15 +123,23 @@ def timestamp(s_sep='-'):
 
 def get_seed():
     """
-    Get seed from computer clock
+    Get a fresh random seed from the operating system entropy
     :return: int
     """
-    import datetime
-    def_now = datetime.datetime.now()
-    hr = def_now.strftime('%H')
-    mn = def_now.strftime('%M')
-    sg = def_now.strftime('%S')
-    return int(sg + mn + hr)
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+
+def get_rng(n_seed=None, tpl_keys=()):
+    """
+    Get a random generator. Generators of the same seed and different keys are
+    independent substreams (e.g. one per step or per tile), so a whole run is
+    reproducible from a single master seed regardless of the order they are drawn.
+    :param n_seed: int master seed (default: from the operating system entropy)
+    :param tpl_keys: tuple of ints of the substream keys
+    :return: numpy random Generator
+    """
+    seq = np.random.SeedSequence(entropy=n_seed, spawn_key=tuple(int(k) for k in tpl_keys))
+    return np.random.default_rng(seq)
 
 
 def create_rundir(label='', wkplc='C:'):
@@ -152,3 +168,86 @@ def status(msg='Status message', process=True):
 
 
 
+
+
+def pack_bits(grd):
+    """
+    Pack a binary array into uint64 words along the last axis
+    :param grd: numpy array of 0/1 values (1d, 2d or 3d)
+    :return: numpy array of uint64 words, last axis of size ceil(n_cells / 64)
+    """
+    grd = np.asarray(grd)
+    n_cells = np.shape(grd)[-1]
+    n_words = (n_cells + 63) // 64
+    # cell j goes to bit j % 64 of word j // 64
+    grd_bytes = np.packbits(grd != 0, axis=-1, bitorder='little')
+    lst_pad = [(0, 0)] * (grd.ndim - 1) + [(0, 8 * n_words - np.shape(grd_bytes)[-1])]
+    grd_bytes = np.pad(grd_bytes, pad_width=lst_pad)
+    return grd_bytes.view('<u8').astype('uint64')
+
+
+def unpack_bits(grd_packed, n_cells):
+    """
+    Unpack uint64 words into a binary array along the last axis
+    :param grd_packed: numpy array of uint64 words
+    :param n_cells: int number of cells along the last axis
+    :return: numpy array of uint8 0/1 values
+    """
+    grd_bytes = np.ascontiguousarray(grd_packed, dtype='<u8').view('uint8')
+    return np.unpackbits(grd_bytes, axis=-1, count=n_cells, bitorder='little')
+
+
+def roll_bits(grd_packed, n_cells, n_shift=1):
+    """
+    Periodic roll of packed cells by one position along the last axis
+    :param grd_packed: numpy array of uint64 words
+    :param n_cells: int number of cells along the last axis
+    :param n_shift: int 1 or -1, same convention as np.roll
+    :return: numpy array of uint64 words
+    """
+    n_tail = n_cells % 64  # used bits in the last word (0 means full)
+    if n_shift == 1:
+        # cell j takes cell j - 1, carry bit 63 from the previous word
+        grd_rolled = (grd_packed << 1) | (np.roll(grd_packed, 1, axis=-1) >> 63)
+        if n_tail:
+            # cell 0 takes the last cell, which sits inside the tail word
+            grd_rolled[..., 0] |= (grd_packed[..., -1] >> (n_tail - 1)) & 1
+    elif n_shift == -1:
+        # cell j takes cell j + 1, carry bit 0 from the next word
+        grd_rolled = (grd_packed >> 1) | (np.roll(grd_packed, -1, axis=-1) << 63)
+        if n_tail:
+            # last cell takes cell 0
+            grd_rolled[..., -1] |= (grd_packed[..., 0] & 1) << (n_tail - 1)
+    else:
+        raise ValueError('n_shift must be 1 or -1, got {}'.format(n_shift))
+    if n_tail:
+        # keep the padding bits clear
+        grd_rolled[..., -1] &= np.uint64((1 << n_tail) - 1)
+    return grd_rolled
+
+
+def jit(func):
+    """
+    Compile a kernel with numba when it is installed, otherwise return it unchanged.
+    Compiled code is cached on disk, so the compile cost is paid once per kernel
+    and argument types, not on every run.
+    :param func: kernel function
+    :return: compiled (or plain) function
+    """
+    if HAS_NUMBA:
+        return numba.njit(cache=True)(func)
+    return func
+
+
+def use_numba(backend='numpy'):
+    """
+    Check a backend name and tell whether the compiled kernels should run
+    :param backend: string 'numpy' or 'numba'
+    :return: boolean
+    """
+    if backend not in ('numpy', 'numba'):
+        raise ValueError('unknown backend: {}'.format(backend))
+    if backend == 'numba' and not HAS_NUMBA:
+        status('numba is not installed, falling back to numpy')
+        return False
+    return backend == 'numba'
@@ -47,7 +47,8 @@ import os
 
 import numpy as np
 from out import export_gif
-from backend import create_rundir, get_window_ids, drop_center_cell, status
+from backend import create_rundir, get_window_ids, drop_center_cell, get_seed, get_rng, status, pack_bits, unpack_bits, roll_bits, \
+    jit, use_numba
 
 def gosper_gun(n_grid=60):
     """
@@ -94,45 +95,465 @@ def infinte_pattern(n_grid=60):
     return grd_full
 
 
+def random_soups(n_worlds, n_grid=60, r_density=0.15, n_seed=None):
+    """
+    Get a batch of random soups
+    :param n_worlds: int number of worlds
+    :param n_grid: int grid size n x n
+    :param r_density: float probability of a live cell
+    :param n_seed: int random seed (default: from the operating system entropy).
+    Each world draws from its own substream, so world k is the same for any n_worlds
+    :return: 3d numpy array (worlds x n x n)
+    """
+    if n_seed is None:
+        n_seed = get_seed()
+    grd3_soups = np.zeros(shape=(n_worlds, n_grid, n_grid), dtype='uint8')
+    for k in range(n_worlds):
+        rng = get_rng(n_seed=n_seed, tpl_keys=(k,))
+        grd3_soups[k] = rng.random(size=(n_grid, n_grid)) < r_density
+    return grd3_soups
+
+
 def compute_next(grd, vct_rows_ids, vct_cols_ids):
     """
-    Conway Game of Life step function
-    :param grd: 2d numpy array start grid
+    Conway Game of Life step function (vectorized over the whole grid)
+    :param grd: 2d numpy array start grid (or 3d array of grids stacked on the first axis)
     :param vct_rows_ids: 1d numpy array base window row vector
     :param vct_cols_ids: 1d numpy array base window cols vector
     :return: 2d numpy array next grid
     """
-    # copy current array
-    m_next = grd.copy()
-    # get parameters
+    # neighbor count: one shifted copy of the grid per window cell.
+    # window ids are already taken modulo the grid size, so rolling by
+    # the negative offset reproduces grd[(i + r) % n_rows, (j + c) % n_cols]
+    grd_sum = np.zeros(shape=np.shape(grd), dtype='uint8')
+    for k in range(len(vct_rows_ids)):
+        grd_sum += np.roll(grd,
+                           shift=(-int(vct_rows_ids[k]), -int(vct_cols_ids[k])),
+                           axis=(-2, -1)).astype('uint8')
+    # apply rules:
+    # live cell survives with 2 or 3 neighbors, dead cell is born with 3
+    m_next = np.where(grd_sum == 3, 1, np.where(grd_sum == 2, grd, 0))
+    return m_next.astype(grd.dtype)
+
+
+def parse_rule(s_rule='B3/S23'):
+    """
+    Parse a Life-like rule in B/S notation (eg. B3/S23, B36/S23, B2/S)
+    :param s_rule: string rule
+    :return: set of birth counts, set of survival counts
+    """
+    dct_sets = dict()
+    for s_part in s_rule.upper().replace(' ', '').split('/'):
+        if len(s_part) == 0 or s_part[0] not in ('B', 'S') or s_part[0] in dct_sets \
+                or not all(s_digit in '012345678' for s_digit in s_part[1:]):
+            raise ValueError('invalid B/S rule: {}'.format(s_rule))
+        dct_sets[s_part[0]] = set(int(s_digit) for s_digit in s_part[1:])
+    if len(dct_sets) != 2:
+        raise ValueError('invalid B/S rule: {}'.format(s_rule))
+    return dct_sets['B'], dct_sets['S']
+
+
+def get_rule_table(s_rule='B3/S23'):
+    """
+    Compile a Life-like rule into a lookup table of 3x3 neighborhoods.
+    Bit k of the table index is the cell k of the window in row-major order
+    (the center cell is bit 4).
+    :param s_rule: string rule in B/S notation
+    :return: 1d numpy array of 512 uint8 next states
+    """
+    set_birth, set_survive = parse_rule(s_rule)
+    vct_table = np.zeros(512, dtype='uint8')
+    for n_idx in range(512):
+        n_sum = bin(n_idx & ~(1 << 4)).count('1')
+        if (n_idx >> 4) & 1:
+            vct_table[n_idx] = n_sum in set_survive
+        else:
+            vct_table[n_idx] = n_sum in set_birth
+    return vct_table
+
+
+def get_neighborhood_ids(grd):
+    """
+    Get the 3x3 neighborhood table index of every cell (torus)
+    :param grd: numpy array of 0/1 values, cells on the last two axes
+    :return: numpy array of uint16 table indices
+    """
+    grd_ids = np.zeros(shape=np.shape(grd), dtype='uint16')
+    k = 0
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            grd_ids |= np.roll(grd, shift=(-di, -dj), axis=(-2, -1)).astype('uint16') << k
+            k = k + 1
+    return grd_ids
+
+
+def compute_next_lut(grd, vct_table):
+    """
+    Life-like step function through a compiled rule table
+    :param grd: 2d numpy array start grid
+    :param vct_table: 1d numpy array rule table, see get_rule_table
+    :return: 2d numpy array next grid
+    """
+    return vct_table[get_neighborhood_ids(grd)].astype(grd.dtype)
+
+
+@jit
+def compute_next_jit(grd, vct_table):
+    """
+    Life-like step function as a per-cell kernel, compiled when numba is installed
+    :param grd: 2d numpy array start grid
+    :param vct_table: 1d numpy array rule table, see get_rule_table
+    :return: 2d numpy array next grid
+    """
+    n_rows, n_cols = grd.shape
+    grd_next = np.empty_like(grd)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            # neighborhood table index, row-major window bits
+            n_idx = 0
+            k = 0
+            for di in range(-1, 2):
+                for dj in range(-1, 2):
+                    if grd[(i + di) % n_rows, (j + dj) % n_cols] != 0:
+                        n_idx += 1 << k
+                    k += 1
+            grd_next[i, j] = vct_table[n_idx]
+    return grd_next
+
+
+def warmup():
+    """
+    Compile the CGL kernels ahead of a timed run (no effect without numba)
+    :return: none
+    """
+    compute_next_jit(np.zeros(shape=(3, 3), dtype='uint8'), get_rule_table('B3/S23'))
+
+
+def compute_next_packed(grd_packed, n_cols):
+    """
+    Conway Game of Life step function on a bit-packed grid
+    :param grd_packed: 2d numpy array of uint64 words (rows x words), see backend.pack_bits
+    :param n_cols: int number of grid columns (cells per row)
+    :return: 2d numpy array of uint64 words next grid
+    """
+    # the 8 neighbor planes: rows above and below, and each of the three
+    # rows rolled one cell to the left and to the right (torus wrap)
+    grd_up = np.roll(grd_packed, 1, axis=-2)
+    grd_down = np.roll(grd_packed, -1, axis=-2)
+    lst_planes = [grd_up, grd_down]
+    for grd_row in (grd_packed, grd_up, grd_down):
+        lst_planes.append(roll_bits(grd_row, n_cells=n_cols, n_shift=1))
+        lst_planes.append(roll_bits(grd_row, n_cells=n_cols, n_shift=-1))
+    # bit-sliced counter: s0, s1, s2 hold the neighbor count modulo 8
+    # for 64 cells per word (a count of 8 reads as 0, which is dead anyway)
+    s0 = np.zeros_like(grd_packed)
+    s1 = np.zeros_like(grd_packed)
+    s2 = np.zeros_like(grd_packed)
+    for grd_plane in lst_planes:
+        c0 = s0 & grd_plane
+        s0 ^= grd_plane
+        c1 = s1 & c0
+        s1 ^= c0
+        s2 ^= c1
+    # apply rules: count is 3, or count is 2 and the cell is alive
+    return s1 & ~s2 & (s0 | grd_packed)
+
+
+def compute_next_halo(grd_halo, vct_table=None):
+    """
+    Conway Game of Life step function for a block padded with a one-cell halo
+    :param grd_halo: 2d numpy array block with one extra row/col on each side
+    :param vct_table: 1d numpy array Life-like rule table (default: Conway rule)
+    :return: 2d numpy array next block interior (halo dropped)
+    """
+    n_rows = len(grd_halo) - 2
+    n_cols = len(grd_halo[0]) - 2
+    grd = grd_halo[1:-1, 1:-1]
+    if vct_table is not None:
+        # neighborhood table index from the 9 shifted views
+        grd_ids = np.zeros(shape=(n_rows, n_cols), dtype='uint16')
+        k = 0
+        for di in (0, 1, 2):
+            for dj in (0, 1, 2):
+                grd_ids |= grd_halo[di: di + n_rows, dj: dj + n_cols].astype('uint16') << k
+                k = k + 1
+        return vct_table[grd_ids].astype(grd_halo.dtype)
+    # neighbor count from the 8 shifted views of the halo block
+    grd_sum = np.zeros(shape=(n_rows, n_cols), dtype='uint8')
+    for di in (0, 1, 2):
+        for dj in (0, 1, 2):
+            if di != 1 or dj != 1:
+                grd_sum += grd_halo[di: di + n_rows, dj: dj + n_cols].astype('uint8')
+    # apply rules
+    m_next = np.where(grd_sum == 3, 1, np.where(grd_sum == 2, grd, 0))
+    return m_next.astype(grd_halo.dtype)
+
+
+def compute_next_tiled(grd, set_tiles, n_tile=16, vct_table=None):
+    """
+    Conway Game of Life step function that recomputes only the given tiles.
+    The grid is updated in place.
+    :param grd: 2d numpy array grid
+    :param set_tiles: set of (tile row, tile col) tuples to recompute
+    :param n_tile: int tile size in cells
+    :param vct_table: 1d numpy array Life-like rule table (default: Conway rule)
+    :return: set of (tile row, tile col) tuples of the tiles that changed
+    """
     n_rows = len(grd)
     n_cols = len(grd[0])
-    # scanning loop
-    for i in range(n_rows): # rows
-        for j in range(n_cols): # columns
-            vct_window = grd[(i + vct_rows_ids) % n_rows, (j + vct_cols_ids) % n_cols]
-            # apply rules
-            window_sum = np.sum(vct_window)
-            # live cell
-            if grd[i][j] == 1:
-                if window_sum == 2 or window_sum == 3:
-                    m_next[i][j] = 1
-                else:
-                    m_next[i][j] = 0
-            else:
-                if window_sum == 3:
-                    m_next[i][j] = 1
-    return m_next
+    # compute all tiles from the current grid before writing any of them
+    lst_updates = list()
+    for ti, tj in set_tiles:
+        i0 = ti * n_tile
+        i1 = min(i0 + n_tile, n_rows)
+        j0 = tj * n_tile
+        j1 = min(j0 + n_tile, n_cols)
+        # halo indices wrap around the torus
+        vct_rows = np.arange(i0 - 1, i1 + 1) % n_rows
+        vct_cols = np.arange(j0 - 1, j1 + 1) % n_cols
+        grd_block = compute_next_halo(grd_halo=grd[np.ix_(vct_rows, vct_cols)], vct_table=vct_table)
+        if not np.array_equal(grd_block, grd[i0:i1, j0:j1]):
+            lst_updates.append((ti, tj, grd_block))
+    set_changed = set()
+    for ti, tj, grd_block in lst_updates:
+        grd[ti * n_tile: ti * n_tile + len(grd_block), tj * n_tile: tj * n_tile + len(grd_block[0])] = grd_block
+        set_changed.add((ti, tj))
+    return set_changed
 
 
-def play(grd_start, n_gens, trace=True):
+def get_dirty_tiles(set_changed, n_tile_rows, n_tile_cols):
+    """
+    Get the tiles to recompute: the changed tiles and their 8 neighbors (torus)
+    :param set_changed: set of (tile row, tile col) tuples that changed
+    :param n_tile_rows: int number of tile rows
+    :param n_tile_cols: int number of tile cols
+    :return: set of (tile row, tile col) tuples
+    """
+    set_dirty = set()
+    for ti, tj in set_changed:
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                set_dirty.add(((ti + di) % n_tile_rows, (tj + dj) % n_tile_cols))
+    return set_dirty
+
+
+def get_cells(grd):
+    """
+    Get the live cells of a grid as sorted int64 keys of an unbounded plane
+    :param grd: 2d numpy array grid (placed at rows/cols 0, 1, 2, ...)
+    :return: 1d numpy array of int64 cell keys
+    """
+    vct_rows, vct_cols = np.nonzero(grd)
+    # row and col are offset by 2^30 and packed into the high and low 32 bits
+    vct_cells = ((vct_rows.astype('int64') + 2 ** 30) << 32) + (vct_cols.astype('int64') + 2 ** 30)
+    return np.sort(vct_cells)
+
+
+def get_coords(vct_cells):
+    """
+    Decode int64 cell keys into plane coordinates
+    :param vct_cells: 1d numpy array of int64 cell keys
+    :return: 1d numpy array (rows), 1d numpy array (cols)
+    """
+    return (vct_cells >> 32) - 2 ** 30, (vct_cells & 0xFFFFFFFF) - 2 ** 30
+
+
+def get_window(vct_cells, n_rows, n_cols):
+    """
+    Paint the window [0, n_rows) x [0, n_cols) of the plane from cell keys
+    :param vct_cells: 1d numpy array of int64 cell keys
+    :param n_rows: int window rows
+    :param n_cols: int window cols
+    :return: 2d numpy array
+    """
+    grd = np.zeros(shape=(n_rows, n_cols), dtype='uint8')
+    vct_rows, vct_cols = get_coords(vct_cells)
+    b_inside = (vct_rows >= 0) & (vct_rows < n_rows) & (vct_cols >= 0) & (vct_cols < n_cols)
+    grd[vct_rows[b_inside], vct_cols[b_inside]] = 1
+    return grd
+
+
+def compute_next_sparse(vct_cells, s_rule='B3/S23'):
+    """
+    Conway Game of Life step function on the unbounded plane, storing only live cells
+    :param vct_cells: 1d numpy array of sorted int64 cell keys
+    :param s_rule: string Life-like rule in B/S notation (without B0)
+    :return: 1d numpy array of sorted int64 cell keys next generation
+    """
+    # neighbor keys: a row step is 2^32 and a col step is 1 in key space
+    vct_offsets = np.array([di * 2 ** 32 + dj for di in (-1, 0, 1) for dj in (-1, 0, 1) if di != 0 or dj != 0],
+                           dtype='int64')
+    vct_nbrs = (vct_cells[:, None] + vct_offsets[None, :]).ravel()
+    # only cells next to a live cell can be alive next
+    vct_keys, vct_sum = np.unique(vct_nbrs, return_counts=True)
+    b_live = np.isin(vct_keys, vct_cells, assume_unique=True)
+    # apply rules
+    set_birth, set_survive = parse_rule(s_rule)
+    b_next = np.where(b_live, np.isin(vct_sum, list(set_survive)), np.isin(vct_sum, list(set_birth)))
+    return vct_keys[b_next]
+
+
+def _stripe_worker(lst_shm_names, tpl_shape, s_dtype, n_i0, n_i1, n_steps, barrier, queue_errors, vct_table=None):
+    """
+    Worker routine of the parallel engine: steps rows [n_i0, n_i1) of a grid
+    in shared memory, reading one-cell halos from the neighbor stripes
+    :param lst_shm_names: list of the two shared memory buffer names
+    :param tpl_shape: tuple grid shape
+    :param s_dtype: string grid dtype
+    :param n_i0: int first stripe row
+    :param n_i1: int stripe end row (exclusive)
+    :param n_steps: int number of steps
+    :param barrier: multiprocessing barrier shared with the main process
+    :param queue_errors: multiprocessing queue that receives the traceback of a failure
+    :param vct_table: 1d numpy array Life-like rule table (default: Conway rule)
+    :return: none
+    """
+    import traceback
+    from multiprocessing import shared_memory
+    lst_shm = [shared_memory.SharedMemory(name=s_name) for s_name in lst_shm_names]
+    try:
+        lst_grids = [np.ndarray(tpl_shape, dtype=s_dtype, buffer=shm.buf) for shm in lst_shm]
+        # halo indices wrap around the torus
+        vct_rows = np.arange(n_i0 - 1, n_i1 + 1) % tpl_shape[0]
+        vct_cols = np.arange(-1, tpl_shape[1] + 1) % tpl_shape[1]
+        for k in range(n_steps):
+            grd = lst_grids[k % 2]
+            lst_grids[(k + 1) % 2][n_i0:n_i1] = compute_next_halo(grd_halo=grd[np.ix_(vct_rows, vct_cols)],
+                                                                  vct_table=vct_table)
+            # generation barrier: all stripes written before anyone reads halos
+            barrier.wait()
+        del grd, lst_grids
+    except BaseException:
+        # report the cause before releasing the other processes
+        queue_errors.put(traceback.format_exc())
+        barrier.abort()
+        raise
+    finally:
+        for shm in lst_shm:
+            shm.close()
+
+
+def _play_parallel(grd_start, n_gens, grd3_traced=None, n_workers=None, vct_table=None):
+    """
+    Run the CGL main loop over row stripes in a process pool
+    :param grd_start: 2d numpy array start grid
+    :param n_gens: int number of generations
+    :param grd3_traced: 3d numpy array to fill with the traced generations (or None)
+    :param n_workers: int number of worker processes (default: number of cpus)
+    :param vct_table: 1d numpy array Life-like rule table (default: Conway rule)
+    :return: 2d numpy array end grid
+    """
+    import threading
+    import multiprocessing
+    from multiprocessing import shared_memory
+    n_rows = len(grd_start)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_workers = max(1, min(n_workers, n_rows))
+    n_steps = max(n_gens - 1, 0)
+    # double buffer in shared memory: step k reads buffer k % 2
+    lst_shm = [shared_memory.SharedMemory(create=True, size=max(grd_start.nbytes, 1)) for k in range(2)]
+    try:
+        lst_grids = [np.ndarray(np.shape(grd_start), dtype=grd_start.dtype, buffer=shm.buf) for shm in lst_shm]
+        lst_grids[0][:] = grd_start
+        barrier = multiprocessing.Barrier(n_workers + 1)
+        queue_errors = multiprocessing.Queue()
+        vct_bounds = np.linspace(0, n_rows, n_workers + 1).astype(int)
+        lst_procs = list()
+        for w in range(n_workers):
+            proc = multiprocessing.Process(target=_stripe_worker,
+                                           args=([shm.name for shm in lst_shm],
+                                                 np.shape(grd_start),
+                                                 grd_start.dtype.str,
+                                                 int(vct_bounds[w]),
+                                                 int(vct_bounds[w + 1]),
+                                                 n_steps,
+                                                 barrier,
+                                                 queue_errors,
+                                                 vct_table))
+            proc.start()
+            lst_procs.append(proc)
+        try:
+            for i in range(1, n_steps + 1):
+                status('step {}'.format(i))
+                if grd3_traced is not None:
+                    # workers only read this buffer during step i
+                    grd3_traced[i] = lst_grids[(i - 1) % 2]
+                barrier.wait()
+        except BaseException as err:
+            barrier.abort()
+            for proc in lst_procs:
+                proc.join()
+            # a broken barrier means a worker failed: raise its actual error
+            if isinstance(err, threading.BrokenBarrierError) and not queue_errors.empty():
+                raise RuntimeError('parallel worker failed:\n{}'.format(queue_errors.get())) from err
+            raise
+        for proc in lst_procs:
+            proc.join()
+        grd_end = lst_grids[n_steps % 2].copy()
+        del lst_grids
+    finally:
+        for shm in lst_shm:
+            shm.close()
+            shm.unlink()
+    return grd_end
+
+
+def get_state_key(obj_state):
+    """
+    Get a hash key of a model state, used for cycle detection
+    :param obj_state: numpy array state (grid, packed grid or cell keys)
+    :return: bytes digest
+    """
+    import hashlib
+    return hashlib.blake2b(np.ascontiguousarray(obj_state).tobytes(), digest_size=16).digest()
+
+
+def play(grd_start, n_gens, trace=True, engine='dense', n_tile=16, n_workers=None,
+         detect_cycles=False, n_history=1000, rule='B3/S23', backend='numpy'):
     """
     Run the CGL model
     :param grd_start: 2d numpy array start squared grid
     :param n_gens: int number of generations
     :param trace: boolean to trace back all generations
+    :param engine: string stepping engine: 'dense' (one byte per cell) or
+    'packed' (64 cells per uint64 word, traced frames are unpacked) or
+    'tiled' (only tiles near last step changes are recomputed) or
+    'sparse' (unbounded plane storing only live cells: frames and End show the
+    start grid window and Cells holds all live cells coordinates at the end) or
+    'parallel' (row stripes stepped by a process pool over shared memory)
+    :param n_tile: int tile size in cells for the tiled engine
+    :param n_workers: int number of worker processes for the parallel engine
+    (default: number of cpus)
+    :param detect_cycles: boolean to hash each generation and, once a state
+    repeats, skip the remaining whole cycles (traced frames are copied from the
+    cycle). Transient and Period are added to the output (serial engines only)
+    :param n_history: int number of most recent generation hashes kept for
+    cycle detection
+    :param rule: string Life-like rule in B/S notation (eg. B36/S23 for HighLife).
+    Rules other than B3/S23 run through a compiled lookup table; the packed
+    engine is Conway only and the sparse engine does not take B0 rules
+    :param backend: string 'numpy' or 'numba' to run the dense engine through the
+    compiled per-cell kernel (falls back to numpy if numba is not installed).
+    The other engines only run on numpy
     :return: output dict
     """
+    if engine not in ('dense', 'packed', 'tiled', 'sparse', 'parallel'):
+        raise ValueError('unknown engine: {}'.format(engine))
+    if detect_cycles and engine == 'parallel':
+        raise ValueError('cycle detection is not available for the parallel engine')
+    set_birth, set_survive = parse_rule(rule)
+    b_conway = set_birth == {3} and set_survive == {2, 3}
+    if engine == 'packed' and not b_conway:
+        raise ValueError('the packed engine only runs the B3/S23 rule, got {}'.format(rule))
+    if engine == 'sparse' and 0 in set_birth:
+        raise ValueError('the sparse engine cannot run B0 rules, got {}'.format(rule))
+    vct_table = None if b_conway else get_rule_table(rule)
+    if backend == 'numba' and engine != 'dense':
+        raise ValueError('the numba backend only runs the dense engine, got {}'.format(engine))
+    b_jit = use_numba(backend)
+    if b_jit:
+        vct_jit_table = get_rule_table(rule)
     # simulation object
     dct_out = {'Start': grd_start.copy()}
     # get window paramters
@@ -140,21 +561,149 @@ def play(grd_start, n_gens, trace=True):
     n_cols = len(grd_start[0])
     vct_rows_ids, vct_cols_ids = get_window_ids(n_rows=n_rows, n_cols=n_cols, n_rsize=1, b_flat=True)
     vct_rows_ids, vct_cols_ids = drop_center_cell(vct_window_rows=vct_rows_ids, vct_window_cols=vct_cols_ids)
+    if engine == 'packed':
+        grd_packed = pack_bits(grd_start)
+    elif engine == 'tiled':
+        # tiled steps work in place, so keep the input untouched
+        grd_start = grd_start.copy()
+        n_tile_rows = (n_rows + n_tile - 1) // n_tile
+        n_tile_cols = (n_cols + n_tile - 1) // n_tile
+        # every tile is dirty at start
+        set_tiles = set((ti, tj) for ti in range(n_tile_rows) for tj in range(n_tile_cols))
+    elif engine == 'sparse':
+        vct_cells = get_cells(grd_start)
     # set extra variables
     if trace:
         grd3_traced = np.zeros(shape=(n_gens, len(grd_start), len(grd_start)), dtype='uint8')
-    # main loop
-    for i in range(1, n_gens):
-        status('step {}'.format(i))
-        if trace:
-            grd3_traced[i] = grd_start.copy()
-        # compute next
-        grd_start = compute_next(grd=grd_start,
-                                 vct_rows_ids=vct_rows_ids,
-                                 vct_cols_ids=vct_cols_ids)
+    if detect_cycles:
+        dct_history = dict()  # state key -> generation
+        n_transient = None
+        n_period = None
+    if engine == 'parallel':
+        grd_start = _play_parallel(grd_start=grd_start,
+                                   n_gens=n_gens,
+                                   grd3_traced=grd3_traced if trace else None,
+                                   n_workers=n_workers,
+                                   vct_table=vct_table)
+    else:
+        # main loop
+        i = 1
+        while i < n_gens:
+            if detect_cycles and n_period is None:
+                # key of the current generation i - 1
+                if engine == 'packed':
+                    s_key = get_state_key(grd_packed)
+                elif engine == 'sparse':
+                    s_key = get_state_key(vct_cells)
+                else:
+                    s_key = get_state_key(grd_start)
+                if s_key in dct_history:
+                    n_transient = dct_history[s_key]
+                    n_period = i - 1 - n_transient
+                    status('cycle found: transient {} period {}'.format(n_transient, n_period))
+                    # skip whole cycles, the state is the same after them
+                    n_skip = ((n_gens - i) // n_period) * n_period
+                    if trace:
+                        for k in range(i, i + n_skip):
+                            grd3_traced[k] = grd3_traced[k - n_period]
+                    i = i + n_skip
+                    if i >= n_gens:
+                        break
+                else:
+                    dct_history[s_key] = i - 1
+                    if len(dct_history) > n_history:
+                        # drop the oldest generation
+                        del dct_history[next(iter(dct_history))]
+            status('step {}'.format(i))
+            if engine == 'packed':
+                if trace:
+                    grd3_traced[i] = unpack_bits(grd_packed, n_cells=n_cols)
+                grd_packed = compute_next_packed(grd_packed=grd_packed, n_cols=n_cols)
+            elif engine == 'tiled':
+                if trace:
+                    grd3_traced[i] = grd_start
+                set_changed = compute_next_tiled(grd=grd_start, set_tiles=set_tiles, n_tile=n_tile,
+                                                 vct_table=vct_table)
+                set_tiles = get_dirty_tiles(set_changed=set_changed, n_tile_rows=n_tile_rows, n_tile_cols=n_tile_cols)
+            elif engine == 'sparse':
+                if trace:
+                    grd3_traced[i] = get_window(vct_cells, n_rows=n_rows, n_cols=n_cols)
+                vct_cells = compute_next_sparse(vct_cells=vct_cells, s_rule=rule)
+            else:
+                if trace:
+                    grd3_traced[i] = grd_start.copy()
+                # compute next
+                if b_jit:
+                    grd_start = compute_next_jit(grd=grd_start, vct_table=vct_jit_table)
+                elif vct_table is None:
+                    grd_start = compute_next(grd=grd_start,
+                                             vct_rows_ids=vct_rows_ids,
+                                             vct_cols_ids=vct_cols_ids)
+                else:
+                    grd_start = compute_next_lut(grd=grd_start, vct_table=vct_table)
+            i = i + 1
+    if engine == 'packed':
+        grd_start = unpack_bits(grd_packed, n_cells=n_cols).astype(grd_start.dtype)
+    elif engine == 'sparse':
+        grd_start = get_window(vct_cells, n_rows=n_rows, n_cols=n_cols).astype(grd_start.dtype)
+        vct_rows, vct_cols = get_coords(vct_cells)
+        dct_out['Cells'] = np.stack([vct_rows, vct_cols], axis=1)
     # output
     dct_out['End'] = grd_start.copy()
     if trace:
         dct_out['Evolution'] = grd3_traced
+    if detect_cycles:
+        dct_out['Transient'] = n_transient
+        dct_out['Period'] = n_period
     return dct_out
 
+
+def play_ensemble(grd3_start, n_gens, engine='dense', rule='B3/S23'):
+    """
+    Run a batch of CGL worlds stepped together by one vectorized kernel
+    :param grd3_start: 3d numpy array start grids (worlds x n x n)
+    :param n_gens: int number of generations
+    :param engine: string stepping engine: 'dense' or 'packed' (B3/S23 only)
+    :param rule: string Life-like rule in B/S notation
+    :return: output dict, with Population as a 2d array (worlds x generations)
+    """
+    if engine not in ('dense', 'packed'):
+        raise ValueError('unknown engine for ensembles: {}'.format(engine))
+    # simulation object
+    dct_out = {'Start': grd3_start.copy()}
+    n_worlds = len(grd3_start)
+    n_rows = len(grd3_start[0])
+    n_cols = len(grd3_start[0][0])
+    vct_rows_ids, vct_cols_ids = get_window_ids(n_rows=n_rows, n_cols=n_cols, n_rsize=1, b_flat=True)
+    vct_rows_ids, vct_cols_ids = drop_center_cell(vct_window_rows=vct_rows_ids, vct_window_cols=vct_cols_ids)
+    set_birth, set_survive = parse_rule(rule)
+    b_conway = set_birth == {3} and set_survive == {2, 3}
+    if engine == 'packed' and not b_conway:
+        raise ValueError('the packed engine only runs the B3/S23 rule, got {}'.format(rule))
+    vct_table = None if b_conway else get_rule_table(rule)
+    grd3 = grd3_start.copy()
+    if engine == 'packed':
+        grd3 = pack_bits(grd3)
+    # population of each world at each generation
+    grd_pop = np.zeros(shape=(n_worlds, n_gens), dtype='int64')
+    for i in range(n_gens):
+        if engine == 'packed':
+            grd_pop[:, i] = np.sum(unpack_bits(grd3, n_cells=n_cols), axis=(-2, -1))
+        else:
+            grd_pop[:, i] = np.sum(grd3, axis=(-2, -1))
+        if i == n_gens - 1:
+            break
+        status('step {}'.format(i + 1))
+        # compute next for all worlds at once
+        if engine == 'packed':
+            grd3 = compute_next_packed(grd_packed=grd3, n_cols=n_cols)
+        elif vct_table is None:
+            grd3 = compute_next(grd=grd3, vct_rows_ids=vct_rows_ids, vct_cols_ids=vct_cols_ids)
+        else:
+            grd3 = compute_next_lut(grd=grd3, vct_table=vct_table)
+    if engine == 'packed':
+        grd3 = unpack_bits(grd3, n_cells=n_cols).astype(grd3_start.dtype)
+    # output
+    dct_out['End'] = grd3
+    dct_out['Population'] = grd_pop
+    return dct_out
@@ -115,15 +115,13 @@ def wolfram_recipe():
     vct_start = np.zeros(n_cells, dtype='uint8')
     vct_start[int(n_cells / 2)] = 1
 
-    # run
+    # run and plot frames as the rows are computed
     status('running wolfram cellular automata')
-    grd_run = wolfram.play(vct_start=vct_start, n_gens=n_gens, n_rule=n_rule)
-
-    # plot
-    for i in range(len(grd_run) - n_cells):
+    gen_frames = wolfram.stream(vct_start=vct_start, n_gens=n_gens, n_rule=n_rule, n_window=n_cells)
+    for i, grd_frame in zip(range(n_gens - n_cells), gen_frames):
         status('exporting plot {}'.format(i + 1))
         lcl_fname = 'WCA_{}'.format(str(i).zfill(4))
-        plot_sigle_frame(grd=grd_run[i : i + n_cells],
+        plot_sigle_frame(grd=grd_frame,
                          cmap='Greys_r',
                          ttl='rule {} | t = {}'.format(n_rule, i),
                          folder=dir_frames,
@@ -186,7 +184,42 @@ def schelling_recipe():
         export_gif(dir_output=dir_out, dir_images=dir_frames, nm_gif='animation', kind='png', suf='')
 
 
+def schelling_sweep_recipe():
+    import schelling
+    # workplace
+    wkpl = '/home/ipora/Documents/bin'
+    dir_out = create_rundir(label='SSM_Sweep', wkplc=wkpl)
+
+    # base parameters
+    df_sim_params = pd.DataFrame({'Parameter': ['N_Grid', 'R_Voids', 'N_Steps'],
+                                  'Set': [30, 0.5, 100],
+                                  'Min': [10, 0.05, 10],
+                                  'Max': [100, 0.95, 100]
+                                  })
+    df_agt_params = pd.DataFrame({'Id': [1, 2],
+                                  'Name': ['A', 'B'],
+                                  'SPr': [0.5, 0.5],
+                                  'Freq': [10, 10],
+                                  'Color': ['olive', 'darkgreen']
+                                   })
+    # parameter grid
+    dct_grid = {'SPr': [0.3, 0.4, 0.5, 0.6, 0.7],
+                'R_Voids': [0.1, 0.3, 0.5],
+                'Freq': [[10, 10], [10, 5]]}
+
+    # run
+    status('running schelling`s segregation model sweep')
+    dct_sweep = schelling.sweep(df_sim_params=df_sim_params,
+                                df_agt_params=df_agt_params,
+                                dct_grid=dct_grid,
+                                n_replicates=5,
+                                r_tolerance=0.01)
+    status('exporting summary table')
+    dct_sweep['Summary'].to_csv('{}/summary.txt'.format(dir_out), sep=';', index=False)
+
+
 #cgl_recipe()
 #wolfram_recipe()
 #schelling_recipe()
+#schelling_sweep_recipe()
 
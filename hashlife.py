@@ -0,0 +1,407 @@
+'''
+
+HashLife engine for the Conway Game of Life source code
+
+Copyright (C) 2022 Iporã Brito Possantti
+
+References:
+Gosper, R. Wm. (1984).
+"Exploiting regularities in large cellular spaces". Physica D:
+Nonlinear Phenomena. 10 (1-2): 75-80.
+doi:10.1016/0167-2789(84)90251-3.
+
+************ GNU GENERAL PUBLIC LICENSE ************
+
+https://www.gnu.org/licenses/gpl-3.0.en.html
+
+Permissions:
+ - Commercial use
+ - Distribution
+ - Modification
+ - Patent use
+ - Private use
+
+Conditions:
+ - Disclose source
+ - License and copyright notice
+ - Same license
+ - State changes
+
+Limitations:
+ - Liability
+ - Warranty
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import numpy as np
+
+# quadtree nodes are tuples: (level, population, nw, ne, sw, se)
+# a node of level k covers a 2^k x 2^k square; level 0 nodes are single cells
+OFF = (0, 0, None, None, None, None)
+ON = (0, 1, None, None, None, None)
+
+
+def new_universe(n_cache=1000000):
+    """
+    Get a new HashLife universe (node table, memo table and cache settings)
+    :param n_cache: int cache size limit (nodes + memoized results). When it is
+    exceeded, even in the middle of a jump, the caches are garbage collected down
+    to the entries reachable from the nodes in use (see collect). The cache stays
+    under n_cache entries, or under the live entries plus n_cache / 2 when the
+    pattern in use alone does not fit in the limit
+    :return: universe dict
+    """
+    dct_hl = {'Nodes': dict(),  # canonical nodes keyed by children ids
+              'Memo': dict(),  # memoized results keyed by (node id, step exponent)
+              'Empty': [OFF],  # empty node of each level
+              'Roots': list(),  # nodes in use by the running recursion
+              'N_Cache': n_cache,
+              'N_Next': n_cache,  # cache size of the next collection
+              'Evictions': 0}
+    return dct_hl
+
+
+def cache_size(dct_hl):
+    """
+    Get the current number of cached entries
+    :param dct_hl: universe dict
+    :return: int
+    """
+    return len(dct_hl['Nodes']) + len(dct_hl['Memo'])
+
+
+def evict(dct_hl):
+    """
+    Flush the node and memo tables. Nodes still referenced by the caller stay
+    valid, they are only no longer canonical, which costs cache misses but
+    never changes results.
+    :param dct_hl: universe dict
+    :return: none
+    """
+    dct_hl['Nodes'].clear()
+    dct_hl['Memo'].clear()
+    dct_hl['Evictions'] = dct_hl['Evictions'] + 1
+
+
+def collect(dct_hl, lst_roots=()):
+    """
+    Garbage collect the caches if they are over the size limit. Nodes reachable
+    from the roots, the running recursion and the empty nodes stay canonical, and
+    so do the memoized results of those nodes; everything else is dropped.
+    :param dct_hl: universe dict
+    :param lst_roots: list of extra nodes in use by the caller
+    :return: none
+    """
+    if cache_size(dct_hl) <= dct_hl['N_Next']:
+        return
+    # mark the nodes in use
+    set_live = set()
+    lst_stack = list(lst_roots) + dct_hl['Roots'] + dct_hl['Empty']
+    while lst_stack:
+        node = lst_stack.pop()
+        if node[0] == 0 or id(node) in set_live:
+            continue
+        set_live.add(id(node))
+        lst_stack.extend(node[2:])
+        # results of live nodes are kept with them
+        for n_j in range(node[0] - 1):
+            hit = dct_hl['Memo'].get((id(node), n_j))
+            if hit is not None:
+                lst_stack.append(hit[1])
+    # sweep
+    dct_hl['Nodes'] = {key: node for key, node in dct_hl['Nodes'].items() if id(node) in set_live}
+    dct_hl['Memo'] = {key: hit for key, hit in dct_hl['Memo'].items() if key[0] in set_live}
+    dct_hl['Evictions'] = dct_hl['Evictions'] + 1
+    # when most of the cache is live, wait for it to grow before the next collection
+    dct_hl['N_Next'] = max(dct_hl['N_Cache'], cache_size(dct_hl) + dct_hl['N_Cache'] // 2)
+
+
+def join(dct_hl, nw, ne, sw, se):
+    """
+    Get the canonical node made of four quadrants
+    :param dct_hl: universe dict
+    :param nw: north-west quadrant node
+    :param ne: north-east quadrant node
+    :param sw: south-west quadrant node
+    :param se: south-east quadrant node
+    :return: node
+    """
+    # children are canonical, so their ids identify them
+    key = (id(nw), id(ne), id(sw), id(se))
+    node = dct_hl['Nodes'].get(key)
+    if node is None:
+        node = (nw[0] + 1, nw[1] + ne[1] + sw[1] + se[1], nw, ne, sw, se)
+        dct_hl['Nodes'][key] = node
+    return node
+
+
+def empty(dct_hl, n_level):
+    """
+    Get the empty node of a level
+    :param dct_hl: universe dict
+    :param n_level: int node level
+    :return: node
+    """
+    lst_empty = dct_hl['Empty']
+    while len(lst_empty) <= n_level:
+        e = lst_empty[-1]
+        lst_empty.append(join(dct_hl, e, e, e, e))
+    return lst_empty[n_level]
+
+
+def centre(dct_hl, node):
+    """
+    Embed a node in the middle of an empty node one level up
+    :param dct_hl: universe dict
+    :param node: node of level >= 1
+    :return: node
+    """
+    e = empty(dct_hl, node[0] - 1)
+    return join(dct_hl,
+                join(dct_hl, e, e, e, node[2]),
+                join(dct_hl, e, e, node[3], e),
+                join(dct_hl, e, node[4], e, e),
+                join(dct_hl, node[5], e, e, e))
+
+
+def _life_4x4(dct_hl, node):
+    """
+    Advance the centre of a level 2 node by one generation (brute force)
+    :param dct_hl: universe dict
+    :param node: node of level 2
+    :return: node of level 1
+    """
+    a, b, c, d = node[2:]
+    lst_cells = [[a[2][1], a[3][1], b[2][1], b[3][1]],
+                 [a[4][1], a[5][1], b[4][1], b[5][1]],
+                 [c[2][1], c[3][1], d[2][1], d[3][1]],
+                 [c[4][1], c[5][1], d[4][1], d[5][1]]]
+    lst_next = list()
+    for i in (1, 2):
+        for j in (1, 2):
+            n_sum = sum(lst_cells[i + di][j + dj] for di in (-1, 0, 1) for dj in (-1, 0, 1)) - lst_cells[i][j]
+            # apply rules
+            if n_sum == 3 or (n_sum == 2 and lst_cells[i][j] == 1):
+                lst_next.append(ON)
+            else:
+                lst_next.append(OFF)
+    return join(dct_hl, *lst_next)
+
+
+def successor(dct_hl, node, n_j):
+    """
+    Get the centre of a node advanced 2^n_j generations
+    :param dct_hl: universe dict
+    :param node: node of level k >= 2
+    :param n_j: int step exponent, clamped to k - 2
+    :return: node of level k - 1
+    """
+    n_level = node[0]
+    if node[1] == 0:
+        return node[2]
+    n_j = min(n_j, n_level - 2)
+    key = (id(node), n_j)
+    hit = dct_hl['Memo'].get(key)
+    if hit is not None:
+        return hit[1]
+    # nodes in use by this call are roots of the garbage collection
+    lst_roots = dct_hl['Roots']
+    n_frame = len(lst_roots)
+    lst_roots.append(node)
+    collect(dct_hl)
+
+    def _keep(result):
+        lst_roots.append(result)
+        return result
+
+    if n_level == 2:
+        result = _life_4x4(dct_hl, node)
+    else:
+        a, b, c, d = node[2:]
+        # nine overlapping sub-squares of level k - 1, advanced 2^min(n_j, k - 3)
+        c1 = _keep(successor(dct_hl, a, n_j))
+        c2 = _keep(successor(dct_hl, join(dct_hl, a[3], b[2], a[5], b[4]), n_j))
+        c3 = _keep(successor(dct_hl, b, n_j))
+        c4 = _keep(successor(dct_hl, join(dct_hl, a[4], a[5], c[2], c[3]), n_j))
+        c5 = _keep(successor(dct_hl, join(dct_hl, a[5], b[4], c[3], d[2]), n_j))
+        c6 = _keep(successor(dct_hl, join(dct_hl, b[4], b[5], d[2], d[3]), n_j))
+        c7 = _keep(successor(dct_hl, c, n_j))
+        c8 = _keep(successor(dct_hl, join(dct_hl, c[3], d[2], c[5], d[4]), n_j))
+        c9 = _keep(successor(dct_hl, d, n_j))
+        if n_j < n_level - 2:
+            # slow step: the first stage already advanced 2^n_j, just recentre
+            result = join(dct_hl,
+                          join(dct_hl, c1[5], c2[4], c4[3], c5[2]),
+                          join(dct_hl, c2[5], c3[4], c5[3], c6[2]),
+                          join(dct_hl, c4[5], c5[4], c7[3], c8[2]),
+                          join(dct_hl, c5[5], c6[4], c8[3], c9[2]))
+        else:
+            # full step: a second stage doubles the jump to 2^(k - 2)
+            result = join(dct_hl,
+                          _keep(successor(dct_hl, join(dct_hl, c1, c2, c4, c5), n_j)),
+                          _keep(successor(dct_hl, join(dct_hl, c2, c3, c5, c6), n_j)),
+                          _keep(successor(dct_hl, join(dct_hl, c4, c5, c7, c8), n_j)),
+                          _keep(successor(dct_hl, join(dct_hl, c5, c6, c8, c9), n_j)))
+    del lst_roots[n_frame:]
+    # keep the node in the entry so its id is not reused while cached
+    dct_hl['Memo'][key] = (node, result)
+    return result
+
+
+def from_grid(dct_hl, grd):
+    """
+    Build a node from a grid placed at its top-left corner
+    :param dct_hl: universe dict
+    :param grd: 2d numpy array
+    :return: node of level ceil(log2(max grid size)), at least 1 so that it can
+    be centred in a bigger node
+    """
+    n_level = max(1, int(max(np.shape(grd)) - 1).bit_length())
+    n_size = 1 << n_level
+    grd_full = np.zeros(shape=(n_size, n_size), dtype='uint8')
+    grd_full[:len(grd), :len(grd[0])] = grd != 0
+
+    def _build(grd_sub, k):
+        if k == 0:
+            return ON if grd_sub[0][0] else OFF
+        if not grd_sub.any():
+            return empty(dct_hl, k)
+        h = len(grd_sub) // 2
+        return join(dct_hl,
+                    _build(grd_sub[:h, :h], k - 1),
+                    _build(grd_sub[:h, h:], k - 1),
+                    _build(grd_sub[h:, :h], k - 1),
+                    _build(grd_sub[h:, h:], k - 1))
+
+    return _build(grd_full, n_level)
+
+
+def to_grid(node, n_rows, n_cols, n_row0=0, n_col0=0):
+    """
+    Paint the window [0, n_rows) x [0, n_cols) of the plane from a node
+    :param node: node
+    :param n_rows: int window rows
+    :param n_cols: int window cols
+    :param n_row0: int plane row of the node top-left corner
+    :param n_col0: int plane col of the node top-left corner
+    :return: 2d numpy array
+    """
+    grd = np.zeros(shape=(n_rows, n_cols), dtype='uint8')
+
+    def _paint(node, i, j):
+        n_size = 1 << node[0]
+        if node[1] == 0 or i >= n_rows or j >= n_cols or i + n_size <= 0 or j + n_size <= 0:
+            return
+        if node[0] == 0:
+            grd[i][j] = 1
+            return
+        h = n_size // 2
+        _paint(node[2], i, j)
+        _paint(node[3], i, j + h)
+        _paint(node[4], i + h, j)
+        _paint(node[5], i + h, j + h)
+
+    _paint(node, n_row0, n_col0)
+    return grd
+
+
+def advance(dct_hl, node, n_gens, n_row0=0, n_col0=0):
+    """
+    Advance a pattern on the unbounded plane
+    :param dct_hl: universe dict
+    :param node: node
+    :param n_gens: int number of generations
+    :param n_row0: int plane row of the node top-left corner
+    :param n_col0: int plane col of the node top-left corner
+    :return: node, int plane row and int plane col of its top-left corner
+    """
+    for n_j in reversed(range(int(n_gens).bit_length())):
+        if not (n_gens >> n_j) & 1:
+            continue
+        # pad until the pattern sits in the central quarter, so that it
+        # cannot grow out of the returned central half in 2^n_j generations
+        while node[0] < n_j + 3 or node[2][5][5][1] + node[3][4][4][1] + node[4][3][3][1] + node[5][2][2][1] != node[1]:
+            h = 1 << (node[0] - 1)
+            node = centre(dct_hl, node)
+            n_row0 = n_row0 - h
+            n_col0 = n_col0 - h
+        h = 1 << (node[0] - 2)
+        collect(dct_hl, lst_roots=[node])
+        node = successor(dct_hl, node, n_j)
+        n_row0 = n_row0 + h
+        n_col0 = n_col0 + h
+    return node, n_row0, n_col0
+
+
+def advance_torus(dct_hl, node, n_gens):
+    """
+    Advance a pattern on a torus (the node is one period of the tiling)
+    :param dct_hl: universe dict
+    :param node: node of level m for the 2^m x 2^m torus
+    :param n_gens: int number of generations
+    :return: node of level m
+    """
+    n_level = node[0]
+    for n_j in reversed(range(int(n_gens).bit_length())):
+        if not (n_gens >> n_j) & 1:
+            continue
+        # the tiled plane is a handful of canonical nodes
+        n_top = max(n_level, n_j) + 2
+        root = node
+        for k in range(n_top - n_level):
+            root = join(dct_hl, root, root, root, root)
+        collect(dct_hl, lst_roots=[root])
+        # the result origin is offset by 2^(n_top - 2), a multiple of the
+        # period, so its top-left corner is the advanced torus
+        node = successor(dct_hl, root, n_j)
+        while node[0] > n_level:
+            node = node[2]
+    return node
+
+
+def jump(grd_start, n_gens, torus=True, n_cache=1000000):
+    """
+    Jump a CGL pattern ahead by n_gens generations with HashLife
+    :param grd_start: 2d numpy array start grid
+    :param n_gens: int number of generations to advance
+    :param torus: boolean to wrap the grid as a torus (square grids with a
+    power of two size). Otherwise the pattern runs on the unbounded plane and
+    End shows the start grid window
+    :param n_cache: int cache size limit, see new_universe
+    :return: output dict
+    """
+    n_rows = len(grd_start)
+    n_cols = len(grd_start[0])
+    if torus and (n_rows != n_cols or n_rows & (n_rows - 1) != 0):
+        raise ValueError('torus mode needs a square grid of power of two size, got {} x {}'.format(n_rows, n_cols))
+    # simulation object
+    dct_out = {'Start': grd_start.copy()}
+    dct_hl = new_universe(n_cache=n_cache)
+    node = from_grid(dct_hl, grd=grd_start)
+    if torus:
+        # a 1 x 1 torus is the single cell at the node corner
+        while 1 << node[0] > n_rows:
+            node = node[2]
+        node = advance_torus(dct_hl, node=node, n_gens=n_gens)
+        n_row0, n_col0 = 0, 0
+    else:
+        node, n_row0, n_col0 = advance(dct_hl, node=node, n_gens=n_gens)
+    # output
+    dct_out['End'] = to_grid(node, n_rows, n_cols, n_row0=n_row0, n_col0=n_col0).astype(grd_start.dtype)
+    dct_out['Population'] = node[1]
+    dct_out['Cache'] = cache_size(dct_hl)
+    dct_out['Evictions'] = dct_hl['Evictions']
+    return dct_out
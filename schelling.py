@@ -50,129 +50,516 @@ import pandas as pd
 import numpy as np
 from scipy import ndimage
 import matplotlib.pyplot as plt
-from backend import get_seed, get_window_ids, drop_center_cell, status
+from backend import get_seed, get_rng, get_window_ids, drop_center_cell, status, jit, use_numba
 
 
-def world_random(df_sim_params, df_agt_params):
+def world_random(df_sim_params, df_agt_params, n_seed=None, exact=False):
     """
-    Generate a randomly distributed world of agents
+    Generate a randomly distributed world of agents. Voids and agent types are drawn
+    at once from their joint probabilities (R_Voids and the agent Freq shares of the
+    non-void cells), in chunks of rows so only the final uint8 world is allocated.
     :param df_sim_params: pandas dataframe simulation parameters
     :param df_agt_params: pandas dataframe agent parameters
+    :param n_seed: int random seed (default: from the operating system entropy)
+    :param exact: boolean to place exact counts of voids and of each agent type
+    (the expected counts, rounded) instead of independent draws per cell
     :return: 2d numpy array
     """
     df_agt_params = df_agt_params.copy()
     df_agt_params.sort_values(by='Id', inplace=True)
     # get grid size
     n_grid = int(df_sim_params[df_sim_params['Parameter'] == 'N_Grid']['Set'].values[0])
+    r_voids = df_sim_params[df_sim_params['Parameter'] == 'R_Voids']['Set'].values[0]
+    # joint probabilities of voids and agents
+    vct_ids = np.concatenate([[0], df_agt_params['Id'].values]).astype('uint8')
+    vct_freqs = df_agt_params['Freq'].values
+    vct_probs = np.concatenate([[r_voids], (1 - r_voids) * vct_freqs / np.sum(vct_freqs)])
+    vct_thresholds = np.cumsum(vct_probs)[:-1].astype('float32')
+    # a cell gets the Id of the last threshold below its random number
+    vct_steps = np.diff(vct_ids)
+    # set random state
+    rng = get_rng(n_seed=n_seed)
     # initiate the world grid
     grd_world = np.zeros(shape=(n_grid, n_grid), dtype='uint8')
-    #
-    # set random state
-    np.random.seed(get_seed())
-    # random grid
-    grd_rnd = np.random.random(size=(n_grid, n_grid))
-    vct_probs = df_agt_params['Freq'].values / df_agt_params['Freq'].sum()
-    vct_probs_acc = vct_probs.copy()
-    for i in range(1, len(vct_probs)):
-        vct_probs_acc[i] = vct_probs_acc[i] + vct_probs_acc[i - 1]
-    for i in range(len(vct_probs)):
-        # get local mask
-        if i == 0:
-            grd_lcl_mask = 1 * (grd_rnd <= vct_probs_acc[i])
-        else:
-            grd_lcl_mask = 1 * (grd_rnd > vct_probs_acc[i - 1]) * (grd_rnd <= vct_probs_acc[i])
-        # map agents in the world
-        grd_world = grd_world + (df_agt_params['Id'].values[i] * grd_lcl_mask)
-    # get random non-voids mask
-    r_voids = df_sim_params[df_sim_params['Parameter'] == 'R_Voids']['Set'].values[0]
-    grd_nonvoid_mask = 1 * (np.random.random(size=(n_grid, n_grid)) > r_voids)
-    # apply voids
-    grd_world = grd_world * grd_nonvoid_mask
+    n_chunk = max(1, 2 ** 22 // n_grid)
+    for i in range(0, n_grid, n_chunk):
+        grd_rnd = rng.random(size=(min(n_chunk, n_grid - i), n_grid), dtype='float32')
+        grd_lcl = grd_world[i: i + n_chunk]
+        for k in range(len(vct_thresholds)):
+            grd_lcl += (grd_rnd >= vct_thresholds[k]) * vct_steps[k]
+    if exact:
+        set_counts(grd=grd_world, vct_ids=vct_ids, vct_probs=vct_probs, rng=rng)
     return grd_world
 
 
-def compute_next(grd, df_agt_params, vct_rows_ids, vct_cols_ids):
+def set_counts(grd, vct_ids, vct_probs, rng):
     """
-    Compute the next step world of the SSM
-    :param grd: 2d numpy array of agents
+    Set exact counts of each value of a randomly drawn world. Random cells of the
+    values in excess are relabeled to the values in deficit, so the world stays
+    uniformly distributed over all arrangements of the expected counts.
+    :param grd: 2d numpy array of agents, updated in place
+    :param vct_ids: 1d numpy array of values (voids and agent Ids)
+    :param vct_probs: 1d numpy array of probabilities of each value
+    :param rng: numpy random Generator
+    :return: None
+    """
+    grd_flat = grd.reshape(-1)
+    n_cells = len(grd_flat)
+    # expected counts, rounded by the largest remainders
+    vct_raw = vct_probs * n_cells
+    vct_targets = np.floor(vct_raw).astype('int64')
+    vct_order = np.argsort(vct_targets - vct_raw)
+    vct_targets[vct_order[:n_cells - np.sum(vct_targets)]] += 1
+    # actual counts, chunk by chunk to keep the temporaries small
+    n_chunk = 2 ** 22
+    vct_counts = np.zeros(len(vct_ids), dtype='int64')
+    for n_start in range(0, n_cells, n_chunk):
+        vct_lcl = np.bincount(grd_flat[n_start: n_start + n_chunk], minlength=int(np.max(vct_ids)) + 1)
+        vct_counts += vct_lcl[vct_ids]
+    # free random cells of the values in excess
+    lst_free = list()
+    for k in np.flatnonzero(vct_counts > vct_targets):
+        vct_ranks = np.sort(rng.choice(vct_counts[k], size=vct_counts[k] - vct_targets[k], replace=False))
+        # find the cells of the drawn ranks chunk by chunk
+        n_base = 0
+        for n_start in range(0, n_cells, n_chunk):
+            vct_cells = np.flatnonzero(grd_flat[n_start: n_start + n_chunk] == vct_ids[k])
+            vct_lcl = vct_ranks[(vct_ranks >= n_base) & (vct_ranks < n_base + len(vct_cells))]
+            lst_free.append(n_start + vct_cells[vct_lcl - n_base])
+            n_base += len(vct_cells)
+    if len(lst_free) == 0:
+        return
+    vct_free = rng.permutation(np.concatenate(lst_free))
+    # relabel them to the values in deficit
+    vct_deficits = np.maximum(vct_targets - vct_counts, 0)
+    grd_flat[vct_free] = np.repeat(vct_ids, vct_deficits)
+
+
+def get_agent_arrays(df_agt_params):
+    """
+    Compile the agent parameters into lookup arrays indexed by agent Id
     :param df_agt_params: pandas dataframe agent parameters
+    :return: dict of 1d numpy arrays, one per column (position 0 is the void)
+    """
+    vct_ids = df_agt_params['Id'].to_numpy().astype(int)
+    n_size = int(vct_ids.max()) + 1
+    dct_agents = dict()
+    for s_col in df_agt_params.columns:
+        vct_values = df_agt_params[s_col].to_numpy()
+        if pd.api.types.is_numeric_dtype(df_agt_params[s_col]):
+            vct_array = np.zeros(n_size, dtype=vct_values.dtype)
+        else:
+            # names, colors and other labels
+            vct_array = np.full(n_size, None, dtype=object)
+        vct_array[vct_ids] = vct_values
+        dct_agents[s_col] = vct_array
+    return dct_agents
+
+
+def get_neighbor_counts(grd, dct_agents, vct_rows_ids, vct_cols_ids):
+    """
+    Count occupied neighbors and neighbors of each agent type of every cell in
+    one pass per agent type
+    :param grd: 2d numpy array of agents
+    :param dct_agents: dict of agent parameter arrays, see get_agent_arrays
     :param vct_rows_ids: 1d numpy array base window row vector
     :param vct_cols_ids: 1d numpy array base window cols vector
-    :return: 2d numpy array
+    :return: dict of counts: 'Occupied' 2d numpy array and 'Types' 3d numpy array
+    of neighbors of each agent type, indexed by agent Id
+    """
+    vct_agent_ids = dct_agents['Id'][dct_agents['Id'] > 0]
+    grd_occupied = np.zeros(shape=np.shape(grd), dtype='uint8')
+    grd3_types = np.zeros(shape=(len(dct_agents['Id']), len(grd), len(grd[0])), dtype='uint8')
+    for n_id in vct_agent_ids:
+        b_type = grd == n_id
+        # neighbors of this type, summed over the shifted window cells
+        for k in range(len(vct_rows_ids)):
+            grd3_types[n_id] += np.roll(b_type,
+                                        shift=(-int(vct_rows_ids[k]), -int(vct_cols_ids[k])),
+                                        axis=(0, 1))
+        grd_occupied += grd3_types[n_id]
+    return {'Occupied': grd_occupied, 'Types': grd3_types}
+
+
+def update_neighbor_counts(dct_counts, vct_ids, vct_old, vct_new, vct_rows_ids, vct_cols_ids):
+    """
+    Update the neighbor counts in place after a set of moves. Only the window
+    cells of the old and new positions of each moved agent are touched.
+    :param dct_counts: dict of counts, see get_neighbor_counts
+    :param vct_ids: 1d numpy array of Ids of moved agents
+    :param vct_old: 1d numpy array of old cell flat ids
+    :param vct_new: 1d numpy array of new cell flat ids
+    :param vct_rows_ids: 1d numpy array base window row vector
+    :param vct_cols_ids: 1d numpy array base window cols vector
+    :return: None
+    """
+    n_rows, n_cols = np.shape(dct_counts['Occupied'])
+    grd_ids = np.repeat(vct_ids[:, None], len(vct_rows_ids), axis=1)
+    for vct_cells, n_sign in [(vct_old, -1), (vct_new, 1)]:
+        grd_win_i = (vct_cells[:, None] // n_cols + vct_rows_ids[None, :]) % n_rows
+        grd_win_j = (vct_cells[:, None] % n_cols + vct_cols_ids[None, :]) % n_cols
+        # unbuffered so that shared window cells are counted as many times as needed
+        if n_sign < 0:
+            np.subtract.at(dct_counts['Types'], (grd_ids, grd_win_i, grd_win_j), 1)
+            np.subtract.at(dct_counts['Occupied'], (grd_win_i, grd_win_j), 1)
+        else:
+            np.add.at(dct_counts['Types'], (grd_ids, grd_win_i, grd_win_j), 1)
+            np.add.at(dct_counts['Occupied'], (grd_win_i, grd_win_j), 1)
+
+
+def get_unhappy(grd, dct_agents, dct_counts):
+    """
+    Get the mask of agents whose matching score is below their SPr
+    :param grd: 2d numpy array of agents
+    :param dct_agents: dict of agent parameter arrays, see get_agent_arrays
+    :param dct_counts: dict of counts, see get_neighbor_counts
+    :return: 2d numpy boolean array
+    """
+    grd_occupied = dct_counts['Occupied']
+    # same-type neighbors of each cell
+    grd_match = np.take_along_axis(dct_counts['Types'], grd[None, :, :].astype('intp'), axis=0)[0]
+    # ratio of matching cells to non-void cells (occupied), no neighbors is a bad situation
+    grd_score = np.divide(grd_match, grd_occupied,
+                          out=np.zeros(shape=np.shape(grd)),
+                          where=grd_occupied > 0)
+    return (grd > 0) & (grd_score < dct_agents['SPr'][grd])
+
+
+def get_segregation(grd):
+    """
+    Get the segregation index of a world: the share of same-type neighbors
+    among the occupied neighbors of all agents
+    :param grd: 2d numpy array of agents
+    :return: float
+    """
+    vct_rows_ids, vct_cols_ids = get_window_ids(n_rows=len(grd), n_cols=len(grd[0]), n_rsize=1, b_flat=True)
+    vct_rows_ids, vct_cols_ids = drop_center_cell(vct_window_rows=vct_rows_ids, vct_window_cols=vct_cols_ids)
+    dct_counts = get_neighbor_counts(grd=grd,
+                                     dct_agents={'Id': np.arange(int(np.max(grd)) + 1)},
+                                     vct_rows_ids=vct_rows_ids,
+                                     vct_cols_ids=vct_cols_ids)
+    grd_match = np.take_along_axis(dct_counts['Types'], grd[None, :, :].astype('intp'), axis=0)[0]
+    n_occupied = np.sum(dct_counts['Occupied'][grd > 0], dtype='int64')
+    if n_occupied == 0:
+        return 0.0
+    return float(np.sum(grd_match[grd > 0], dtype='int64') / n_occupied)
+
+
+def get_vacancy_index(grd):
+    """
+    Build the vacancy index of a world: a dense array of void cell flat ids,
+    a position map from cell id to its slot in that array and the vacancy count.
+    :param grd: 2d numpy array of agents
+    :return: dict of the vacancy index
+    """
+    n_cells = np.size(grd)
+    vct_voids = np.flatnonzero(grd == 0)
+    n_count = len(vct_voids)
+    # the ids array has room for every cell of the world
+    vct_ids = np.zeros(n_cells, dtype='int64')
+    vct_ids[:n_count] = vct_voids
+    vct_position = np.full(n_cells, -1, dtype='int64')
+    vct_position[vct_voids] = np.arange(n_count)
+    return {'Ids': vct_ids, 'Position': vct_position, 'Count': n_count}
+
+
+def vacancy_pick(dct_vacancy, r_random):
+    """
+    Pick a vacancy in constant time
+    :param dct_vacancy: dict of the vacancy index
+    :param r_random: float uniform random number in [0, 1)
+    :return: int cell flat id
+    """
+    return int(dct_vacancy['Ids'][int(r_random * dct_vacancy['Count'])])
+
+
+def vacancy_insert(dct_vacancy, n_cell):
+    """
+    Insert a vacancy in constant time
+    :param dct_vacancy: dict of the vacancy index
+    :param n_cell: int cell flat id
+    :return: None
+    """
+    n_count = dct_vacancy['Count']
+    dct_vacancy['Ids'][n_count] = n_cell
+    dct_vacancy['Position'][n_cell] = n_count
+    dct_vacancy['Count'] = n_count + 1
+
+
+def vacancy_remove(dct_vacancy, n_cell):
+    """
+    Remove a vacancy in constant time by swapping it with the last one
+    :param dct_vacancy: dict of the vacancy index
+    :param n_cell: int cell flat id
+    :return: None
+    """
+    n_last = dct_vacancy['Count'] - 1
+    n_slot = dct_vacancy['Position'][n_cell]
+    n_moved = dct_vacancy['Ids'][n_last]
+    dct_vacancy['Ids'][n_slot] = n_moved
+    dct_vacancy['Position'][n_moved] = n_slot
+    dct_vacancy['Position'][n_cell] = -1
+    dct_vacancy['Count'] = n_last
+
+
+def move_local(grd, grd_unhappy, vct_rows_ids, vct_cols_ids, rng):
+    """
+    Move phase of the local relocation mode. All unhappy agents pick a random
+    void neighbor at once. When several agents claim the same void cell, the
+    claim with the highest random key wins and the others stay this step.
+    :param grd: 2d numpy array of agents, updated in place
+    :param grd_unhappy: 2d numpy boolean array of unhappy agents
+    :param vct_rows_ids: 1d numpy array base window row vector
+    :param vct_cols_ids: 1d numpy array base window cols vector
+    :param rng: numpy random Generator
+    :return: 1d numpy array of old cell flat ids, 1d numpy array of new cell flat ids
     """
-    # get seeds
-    np.random.seed(get_seed())
-    seeds = np.random.randint(0, 255, size=np.shape(grd), dtype='uint8')
-    # get window parameters
     n_rows = len(grd)
     n_cols = len(grd[0])
-    # scanning loop
-    for i in range(len(grd)):
-        for j in range(len(grd[i])):
-            # access local i
-            lcl_agent_id = grd[i][j]
+    vct_i, vct_j = np.nonzero(grd_unhappy)
+    # window cells of each unhappy agent (agents x window)
+    grd_win_i = (vct_i[:, None] + vct_rows_ids[None, :]) % n_rows
+    grd_win_j = (vct_j[:, None] + vct_cols_ids[None, :]) % n_cols
+    b_void = grd[grd_win_i, grd_win_j] == 0
+    # random keys where cells are void, the highest key is the target
+    grd_keys = np.where(b_void, rng.random(size=np.shape(b_void)), -1.0)
+    vct_k = np.argmax(grd_keys, axis=1)
+    vct_agents = np.arange(len(vct_i))
+    vct_keys = grd_keys[vct_agents, vct_k]
+    # agents with no void around stay
+    b_moving = vct_keys >= 0
+    vct_agents = vct_agents[b_moving]
+    vct_keys = vct_keys[b_moving]
+    vct_targets = grd_win_i[vct_agents, vct_k[vct_agents]] * n_cols + grd_win_j[vct_agents, vct_k[vct_agents]]
+    # conflict resolution: sort by target, then by decreasing key, keep the first claim
+    vct_order = np.lexsort((-vct_keys, vct_targets))
+    vct_targets = vct_targets[vct_order]
+    b_first = np.ones(len(vct_targets), dtype=bool)
+    b_first[1:] = vct_targets[1:] != vct_targets[:-1]
+    vct_agents = vct_agents[vct_order][b_first]
+    vct_targets = vct_targets[b_first]
+    # exchange values in grid
+    grd[vct_targets // n_cols, vct_targets % n_cols] = grd[vct_i[vct_agents], vct_j[vct_agents]]
+    grd[vct_i[vct_agents], vct_j[vct_agents]] = 0  # void value
+    return vct_i[vct_agents] * n_cols + vct_j[vct_agents], vct_targets
+
+
+def move_global(grd, grd_unhappy, dct_vacancy, rng):
+    """
+    Move phase of the global relocation mode. Unhappy agents are visited in
+    random order and each one jumps to a random vacancy anywhere in the world.
+    :param grd: 2d numpy array of agents, updated in place
+    :param grd_unhappy: 2d numpy boolean array of unhappy agents
+    :param dct_vacancy: dict of the vacancy index, updated in place
+    :param rng: numpy random Generator
+    :return: 1d numpy array of old cell flat ids, 1d numpy array of new cell flat ids
+    """
+    n_cols = len(grd[0])
+    vct_cells = rng.permutation(np.flatnonzero(grd_unhappy))
+    vct_random = rng.random(size=len(vct_cells))
+    vct_targets = np.zeros(len(vct_cells), dtype='int64')
+    n_moves = 0
+    for n in range(len(vct_cells)):
+        if dct_vacancy['Count'] == 0:
+            break
+        n_cell = int(vct_cells[n])
+        n_target = vacancy_pick(dct_vacancy=dct_vacancy, r_random=vct_random[n])
+        vacancy_remove(dct_vacancy=dct_vacancy, n_cell=n_target)
+        vacancy_insert(dct_vacancy=dct_vacancy, n_cell=n_cell)
+        # exchange values in grid
+        grd[n_target // n_cols, n_target % n_cols] = grd[n_cell // n_cols, n_cell % n_cols]
+        grd[n_cell // n_cols, n_cell % n_cols] = 0  # void value
+        vct_targets[n] = n_target
+        n_moves = n + 1
+    return vct_cells[:n_moves], vct_targets[:n_moves]
+
+
+def compute_next(grd, dct_agents, vct_rows_ids, vct_cols_ids, relocation='local', dct_vacancy=None,
+                 dct_counts=None, vct_stats=None, rng=None):
+    """
+    Compute the next step world of the SSM. Satisfaction is evaluated for the
+    whole world at the start of the step from the neighbor counts, then unhappy
+    agents move (see move_local and move_global) and only the counts around the
+    old and new cells of the moved agents are updated.
+
+    In the 'global' relocation mode unhappy agents jump to a random vacancy
+    anywhere in the world, as in the classic Schelling formulation.
+    :param grd: 2d numpy array of agents, updated in place
+    :param dct_agents: dict of agent parameter arrays, see get_agent_arrays
+    :param vct_rows_ids: 1d numpy array base window row vector
+    :param vct_cols_ids: 1d numpy array base window cols vector
+    :param relocation: string 'local' or 'global'
+    :param dct_vacancy: dict of the vacancy index for the 'global' mode, see get_vacancy_index.
+    It is updated in place. If None it is built from the world.
+    :param dct_counts: dict of neighbor counts, see get_neighbor_counts.
+    It is updated in place. If None it is built from the world.
+    :param vct_stats: 1d numpy int array of size 2 that receives the number of
+    unhappy agents and the number of moves (optional)
+    :param rng: numpy random Generator of the step (default: a fresh one, see get_rng)
+    :return: 2d numpy array
+    """
+    if relocation not in ['local', 'global']:
+        raise ValueError('relocation mode not recognized: {}'.format(relocation))
+    # set random state
+    if rng is None:
+        rng = get_rng()
+    if dct_counts is None:
+        dct_counts = get_neighbor_counts(grd=grd,
+                                         dct_agents=dct_agents,
+                                         vct_rows_ids=vct_rows_ids,
+                                         vct_cols_ids=vct_cols_ids)
+    # satisfaction phase
+    grd_unhappy = get_unhappy(grd=grd, dct_agents=dct_agents, dct_counts=dct_counts)
+    # move phase
+    if relocation == 'global':
+        if dct_vacancy is None:
+            dct_vacancy = get_vacancy_index(grd=grd)
+        vct_old, vct_new = move_global(grd=grd, grd_unhappy=grd_unhappy, dct_vacancy=dct_vacancy, rng=rng)
+    else:
+        vct_old, vct_new = move_local(grd=grd,
+                                      grd_unhappy=grd_unhappy,
+                                      vct_rows_ids=vct_rows_ids,
+                                      vct_cols_ids=vct_cols_ids,
+                                      rng=rng)
+    if vct_stats is not None:
+        vct_stats[0] = np.count_nonzero(grd_unhappy)
+        vct_stats[1] = len(vct_new)
+    # counts update of the moved agents
+    n_cols = len(grd[0])
+    update_neighbor_counts(dct_counts=dct_counts,
+                           vct_ids=grd[vct_new // n_cols, vct_new % n_cols],
+                           vct_old=vct_old,
+                           vct_new=vct_new,
+                           vct_rows_ids=vct_rows_ids,
+                           vct_cols_ids=vct_cols_ids)
+    return grd
+
+
+@jit
+def compute_next_jit(grd, vct_spr, vct_rows_ids, vct_cols_ids, n_seed, vct_stats):
+    """
+    Compute the next step world of the SSM as a per-cell kernel, compiled when
+    numba is installed. Same rules as compute_next with local relocation:
+    satisfaction is evaluated on the start-of-step world, then each unhappy agent
+    claims a random void neighbor and the claim with the highest random key wins.
+    Every agent moves at most once per step; the grid is updated in place.
+    :param grd: 2d numpy array of agents
+    :param vct_spr: 1d numpy array of SPr indexed by agent Id
+    :param vct_rows_ids: 1d numpy array base window row vector
+    :param vct_cols_ids: 1d numpy array base window cols vector
+    :param n_seed: int random seed
+    :param vct_stats: 1d numpy int array of size 2 that receives the number of
+    unhappy agents and the number of moves
+    :return: 2d numpy array
+    """
+    np.random.seed(n_seed)
+    vct_stats[0] = 0
+    vct_stats[1] = 0
+    n_rows, n_cols = grd.shape
+    n_window = len(vct_rows_ids)
+    # satisfaction phase on the unmodified world
+    b_unhappy = np.zeros((n_rows, n_cols), dtype=np.bool_)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            lcl_agent_id = grd[i, j]
             # skip voids
             if lcl_agent_id == 0:
-                pass
+                continue
+            n_nonvoid = 0
+            n_match = 0
+            for k in range(n_window):
+                lcl_value = grd[(i + vct_rows_ids[k]) % n_rows, (j + vct_cols_ids[k]) % n_cols]
+                if lcl_value > 0:
+                    n_nonvoid += 1
+                    if lcl_value == lcl_agent_id:
+                        n_match += 1
+            # access matching score
+            if n_nonvoid > 0:
+                lcl_match_score = n_match / n_nonvoid
             else:
-                # get agent parameter
-                lcl_agent_spr = df_agt_params[df_agt_params['Id'] == lcl_agent_id]['SPr'].values[0]
-
-                # get the window vector
-                vct_window = grd[(i + vct_rows_ids) % n_rows, (j + vct_cols_ids) % n_cols]
-
-                # apply rules
-                b_nonvoid = 1 * (vct_window > 0)  # boolean vector of non-void cells
-                n_nonvoid = np.sum(b_nonvoid)  # sum of non-void cells
-                b_void = 1 * (vct_window == 0)  # boolean vector of voids cells
-                n_void = np.sum(b_void)  # sum of void cells
-                b_match = 1 * (vct_window == lcl_agent_id)  # boolean of matching cells
-                n_match = np.sum(b_match)  # sum of matching cells
-
-                # access matching score
-                if n_nonvoid > 0:
-                    lcl_match_score = n_match / n_nonvoid # ratio of matching cell to non-void cells (occupied)
-                    ### lcl_void_score = n_void / len(vct_window)  # ratio of voids
-                else: # no neightboors around, bad situation
-                    lcl_match_score = 0
-
-                if lcl_match_score >= lcl_agent_spr:
-                    ### print('good place, stay')
-                    pass
-                else:
-                    ### print('bad place, you should move')
-                    if np.sum(b_void) > 0:
-                        ### print('there is empty cells around, you can move!')
-                        # random movement
-                        np.random.seed(seeds[i][j])  # set random state
-                        # random scores where cells are void
-                        vct_scores = np.random.random(size=len(vct_window)) * b_void
-                        # get aux dataframe
-                        df_aux = pd.DataFrame({'Rows_ids': (i + vct_rows_ids) % n_rows,
-                                               'Cols_ids':  (j + vct_cols_ids) % n_cols,
-                                               'Score': vct_scores})
-                        # get new position
-                        df_aux.sort_values(by='Score', ascending=False, inplace=True)
-                        #
-                        # exchange values in grid
-                        new_i = df_aux['Rows_ids'].values[0]
-                        new_j = df_aux['Cols_ids'].values[0]
-                        grd[new_i][new_j] = lcl_agent_id
-                        grd[i][j] = 0 # void value
+                lcl_match_score = 0.0
+            if lcl_match_score < vct_spr[lcl_agent_id]:
+                b_unhappy[i, j] = True
+                vct_stats[0] += 1
+    # claim phase: each unhappy agent claims the void neighbor with its highest random key
+    grd_best = np.full((n_rows, n_cols), -1.0)
+    grd_claim = np.full((n_rows, n_cols), -1, dtype=np.int64)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            if not b_unhappy[i, j]:
+                continue
+            r_best = -1.0
+            new_i = i
+            new_j = j
+            for k in range(n_window):
+                lcl_i = (i + vct_rows_ids[k]) % n_rows
+                lcl_j = (j + vct_cols_ids[k]) % n_cols
+                if grd[lcl_i, lcl_j] == 0:
+                    r_score = np.random.random()
+                    if r_score > r_best:
+                        r_best = r_score
+                        new_i = lcl_i
+                        new_j = lcl_j
+            # agents with no void around stay
+            if r_best >= 0 and r_best > grd_best[new_i, new_j]:
+                grd_best[new_i, new_j] = r_best
+                grd_claim[new_i, new_j] = i * n_cols + j
+    # move phase: targets are void and origins occupied at the start, so they never overlap
+    for i in range(n_rows):
+        for j in range(n_cols):
+            n_cell = grd_claim[i, j]
+            if n_cell < 0:
+                continue
+            old_i = n_cell // n_cols
+            old_j = n_cell % n_cols
+            grd[i, j] = grd[old_i, old_j]
+            grd[old_i, old_j] = 0  # void value
+            vct_stats[1] += 1
     return grd
 
 
-def play(grd_start, df_sim_params, df_agt_params, trace=True):
+def warmup():
+    """
+    Compile the SSM kernels ahead of a timed run (no effect without numba)
+    :return: none
+    """
+    vct_rows_ids, vct_cols_ids = get_window_ids(n_rows=3, n_cols=3, n_rsize=1, b_flat=True)
+    vct_rows_ids, vct_cols_ids = drop_center_cell(vct_window_rows=vct_rows_ids, vct_window_cols=vct_cols_ids)
+    compute_next_jit(np.zeros(shape=(3, 3), dtype='uint8'), np.zeros(2), vct_rows_ids, vct_cols_ids, 0,
+                     np.zeros(2, dtype='int64'))
+
+
+def play(grd_start, df_sim_params, df_agt_params, trace=True, backend='numpy', relocation='local',
+         early_stop=True, r_tolerance=None, n_patience=10, n_seed=None, verbose=True):
     """
 
     :param grd_start: 2d numpy array
     :param df_sim_params: pandas dataframe of simulation parameters
     :param df_agt_params: pandas dataframe
     :param trace: boolean to tracebak all model evolution
-    :return: simulation object
+    :param backend: string 'numpy' or 'numba' to run the compiled per-cell kernel
+    (falls back to numpy if numba is not installed)
+    :param relocation: string 'local' to move unhappy agents to a void neighbor or
+    'global' to move them to any vacancy in the world (numpy backend only)
+    :param early_stop: boolean to stop when the model converges: no unhappy agents,
+    no moves in the last step or a plateau of unhappy agents (see r_tolerance)
+    :param r_tolerance: float plateau tolerance as a fraction of the number of agents.
+    The model converges when the number of unhappy agents varies by no more than this
+    over the last n_patience steps. If None the plateau criterion is not used.
+    :param n_patience: int number of steps of the plateau criterion
+    :param n_seed: int master random seed. Each step draws from its own substream of
+    it, so runs of the same seed are identical (default: from the operating system entropy)
+    :param verbose: boolean to print status messages
+    :return: simulation object. 'Unhappy' and 'Moves' are the counts of each step,
+    'Convergence' is the step where the model converged (None if it did not) and
+    'Seed' is the master random seed
     """
     # simulation object
     dct_out = {'Start' : grd_start.copy()}
+    # master random seed
+    if n_seed is None:
+        n_seed = get_seed()
+    dct_out['Seed'] = n_seed
     # get simulation steps
     n_steps = int(df_sim_params[df_sim_params['Parameter'] == 'N_Steps']['Set'].values[0])
     # get window paramters
@@ -180,22 +567,194 @@ def play(grd_start, df_sim_params, df_agt_params, trace=True):
     n_cols = len(grd_start[0])
     vct_rows_ids, vct_cols_ids = get_window_ids(n_rows=n_rows, n_cols=n_cols, n_rsize=1, b_flat=True)
     vct_rows_ids, vct_cols_ids = drop_center_cell(vct_window_rows=vct_rows_ids, vct_window_cols=vct_cols_ids)
+    # agent parameters lookup arrays indexed by agent Id
+    dct_agents = get_agent_arrays(df_agt_params=df_agt_params)
+    if relocation not in ['local', 'global']:
+        raise ValueError('relocation mode not recognized: {}'.format(relocation))
+    if relocation == 'global' and backend == 'numba':
+        raise ValueError('global relocation is not available for the numba backend')
+    b_jit = use_numba(backend)
+    if relocation == 'global':
+        # the vacancy index is kept up to date along the run
+        dct_vacancy = get_vacancy_index(grd=grd_start)
+    else:
+        dct_vacancy = None
+    # the world is updated in place along the run
+    grd_start = grd_start.copy()
+    if b_jit:
+        vct_spr = dct_agents['SPr'].astype('float64')
+    else:
+        # neighbor counts are kept up to date along the run
+        dct_counts = get_neighbor_counts(grd=grd_start,
+                                         dct_agents=dct_agents,
+                                         vct_rows_ids=vct_rows_ids,
+                                         vct_cols_ids=vct_cols_ids)
     # set extra variables
     if trace:
         n_grid = int(df_sim_params[df_sim_params['Parameter'] == 'N_Grid']['Set'].values[0])
         grd3_traced = np.zeros(shape=(n_steps, n_grid, n_grid), dtype='uint8')
+    vct_unhappy = np.zeros(n_steps, dtype='int64')
+    vct_moves = np.zeros(n_steps, dtype='int64')
+    vct_stats = np.zeros(2, dtype='int64')
+    n_agents = np.count_nonzero(grd_start)
+    n_convergence = None
     # main loop
+    n_run = n_steps
     for i in range(n_steps):
-        status('step {}'.format(i))
+        if verbose:
+            status('step {}'.format(i))
         if trace:
             grd3_traced[i] = grd_start.copy()
+        # random substream of the step
+        rng = get_rng(n_seed=n_seed, tpl_keys=(i,))
         # compute next
-        grd_start = compute_next(grd=grd_start,
-                                 df_agt_params=df_agt_params,
-                                 vct_rows_ids=vct_rows_ids,
-                                 vct_cols_ids=vct_cols_ids)
+        if b_jit:
+            grd_start = compute_next_jit(grd=grd_start,
+                                         vct_spr=vct_spr,
+                                         vct_rows_ids=vct_rows_ids,
+                                         vct_cols_ids=vct_cols_ids,
+                                         n_seed=int(rng.integers(2 ** 31)),
+                                         vct_stats=vct_stats)
+        else:
+            grd_start = compute_next(grd=grd_start,
+                                     dct_agents=dct_agents,
+                                     vct_rows_ids=vct_rows_ids,
+                                     vct_cols_ids=vct_cols_ids,
+                                     relocation=relocation,
+                                     dct_vacancy=dct_vacancy,
+                                     dct_counts=dct_counts,
+                                     vct_stats=vct_stats,
+                                     rng=rng)
+        vct_unhappy[i] = vct_stats[0]
+        vct_moves[i] = vct_stats[1]
+        # convergence check
+        if early_stop:
+            b_converged = vct_unhappy[i] == 0 or vct_moves[i] == 0
+            if r_tolerance is not None and i + 1 >= n_patience:
+                vct_window = vct_unhappy[i + 1 - n_patience: i + 1]
+                b_converged = b_converged or (np.max(vct_window) - np.min(vct_window)) <= r_tolerance * n_agents
+            if b_converged:
+                if verbose:
+                    status('converged at step {}'.format(i))
+                n_convergence = i
+                n_run = i + 1
+                break
     # output
     dct_out['End'] = grd_start.copy()
+    dct_out['Unhappy'] = vct_unhappy[:n_run]
+    dct_out['Moves'] = vct_moves[:n_run]
+    dct_out['Convergence'] = n_convergence
     if trace:
-        dct_out['Evolution'] = grd3_traced
-    return dct_out
\ No newline at end of file
+        dct_out['Evolution'] = grd3_traced[:n_run]
+    return dct_out
+
+
+def _sweep_worker(dct_job):
+    """
+    Run one configuration of a sweep
+    :param dct_job: dict of the job: run number, parameters, dataframes and settings
+    :return: dict of the results row and the end grid
+    """
+    grd_start = world_random(df_sim_params=dct_job['Sim'],
+                             df_agt_params=dct_job['Agt'],
+                             n_seed=dct_job['Seed'])
+    dct_sim = play(grd_start,
+                   df_sim_params=dct_job['Sim'],
+                   df_agt_params=dct_job['Agt'],
+                   trace=False,
+                   relocation=dct_job['Relocation'],
+                   r_tolerance=dct_job['Tolerance'],
+                   n_seed=dct_job['Seed'],
+                   verbose=False)
+    dct_row = {'Run': dct_job['Run'], 'Replicate': dct_job['Replicate']}
+    dct_row.update(dct_job['Params'])
+    dct_row['Seed'] = dct_job['Seed']
+    dct_row['Segregation_Start'] = get_segregation(grd_start)
+    dct_row['Segregation_End'] = get_segregation(dct_sim['End'])
+    dct_row['Unhappy_End'] = dct_sim['Unhappy'][-1] if len(dct_sim['Unhappy']) > 0 else 0
+    dct_row['Steps'] = len(dct_sim['Unhappy'])
+    dct_row['Convergence'] = -1 if dct_sim['Convergence'] is None else dct_sim['Convergence']
+    return {'Row': dct_row, 'End': dct_sim['End']}
+
+
+def sweep(df_sim_params, df_agt_params, dct_grid, n_replicates=1, n_workers=None, keep_grids=False,
+          relocation='local', r_tolerance=None, n_seed=None):
+    """
+    Run the SSM over a grid of parameters, fanning the runs out over a process pool.
+    Runs are not traced, so memory is bounded by the end grids (if kept).
+    :param df_sim_params: pandas dataframe of base simulation parameters
+    :param df_agt_params: pandas dataframe of base agent parameters
+    :param dct_grid: dict of parameter name -> list of values. Names in the 'Parameter'
+    column of df_sim_params (e.g. N_Grid, R_Voids, N_Steps) set simulation parameters;
+    names of columns of df_agt_params (e.g. SPr, Freq) set agent parameters, where a value
+    is either a scalar for all agents or a list with one value per agent
+    :param n_replicates: int number of replicates of each configuration
+    :param n_workers: int number of worker processes (default: number of CPUs).
+    1 runs in the current process
+    :param keep_grids: boolean to keep the end grid of every run
+    :param relocation: string relocation mode, see play
+    :param r_tolerance: float plateau tolerance, see play
+    :param n_seed: int master random seed. Each run draws its own seed from a substream
+    (default: from the operating system entropy)
+    :return: output dict, with Summary as a pandas dataframe of one row per run:
+    Run, Replicate, the swept parameters, Seed, Segregation_Start, Segregation_End (see
+    get_segregation), Unhappy_End, Steps and Convergence (-1 if the run did not converge).
+    End is the list of end grids by Run if keep_grids
+    """
+    import itertools
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    lst_sim_names = list(df_sim_params['Parameter'].values)
+    for s_name in dct_grid:
+        if s_name not in lst_sim_names and s_name not in df_agt_params.columns:
+            raise ValueError('unknown sweep parameter: {}'.format(s_name))
+    if n_seed is None:
+        n_seed = get_seed()
+    # jobs
+    lst_names = list(dct_grid.keys())
+    lst_jobs = list()
+    for tpl_values in itertools.product(*[dct_grid[s_name] for s_name in lst_names]):
+        df_sim = df_sim_params.copy()
+        df_agt = df_agt_params.copy()
+        dct_params = dict()
+        for s_name, value in zip(lst_names, tpl_values):
+            if s_name in lst_sim_names:
+                df_sim.loc[df_sim['Parameter'] == s_name, 'Set'] = value
+            else:
+                df_agt[s_name] = value
+            # lists of per-agent values are stored as text in the summary
+            dct_params[s_name] = str(list(value)) if np.ndim(value) > 0 else value
+        for n_rep in range(n_replicates):
+            n_run = len(lst_jobs)
+            lst_jobs.append({'Run': n_run,
+                             'Replicate': n_rep,
+                             'Params': dct_params,
+                             'Sim': df_sim,
+                             'Agt': df_agt,
+                             'Relocation': relocation,
+                             'Tolerance': r_tolerance,
+                             'Seed': int(get_rng(n_seed=n_seed, tpl_keys=(n_run,)).integers(2 ** 32))})
+    status('running {} runs'.format(len(lst_jobs)))
+    # results are collected as they finish
+    lst_rows = list()
+    lst_ends = [None] * len(lst_jobs)
+    if n_workers == 1:
+        for dct_job in lst_jobs:
+            dct_result = _sweep_worker(dct_job)
+            lst_rows.append(dct_result['Row'])
+            if keep_grids:
+                lst_ends[dct_result['Row']['Run']] = dct_result['End']
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            lst_futures = [executor.submit(_sweep_worker, dct_job) for dct_job in lst_jobs]
+            for future in as_completed(lst_futures):
+                dct_result = future.result()
+                lst_rows.append(dct_result['Row'])
+                if keep_grids:
+                    lst_ends[dct_result['Row']['Run']] = dct_result['End']
+                status('run {} done ({}/{})'.format(dct_result['Row']['Run'], len(lst_rows), len(lst_jobs)))
+    df_summary = pd.DataFrame(lst_rows).sort_values(by='Run').reset_index(drop=True)
+    # output
+    dct_out = {'Summary': df_summary}
+    if keep_grids:
+        dct_out['End'] = lst_ends
+    return dct_out
@@ -56,10 +56,10 @@ from backend import get_seed, get_window_ids, drop_center_cell
 
 def beat(i):
     global grd_start
-    global df_agt_params
+    global dct_agents
     global cmap
     global vct_rows_ids, vct_cols_ids
-    grd_start = schelling.compute_next(grd_start, df_agt_params,
+    grd_start = schelling.compute_next(grd_start, dct_agents,
                                        vct_rows_ids=vct_rows_ids,
                                        vct_cols_ids=vct_cols_ids)
     ax1.clear()
@@ -83,6 +83,8 @@ df_agt_params = pd.DataFrame({'Id': [1, 2],
 
 # initial conditions
 grd_start = schelling.world_random(df_sim_params=df_sim_params, df_agt_params=df_agt_params)
+# agent parameters lookup arrays
+dct_agents = schelling.get_agent_arrays(df_agt_params=df_agt_params)
 # get window paramters
 n_rows = len(grd_start)
 n_cols = len(grd_start[0])
@@ -44,7 +44,9 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+from backend import jit, use_numba, pack_bits, unpack_bits, roll_bits
 
 def pattern8():
     """
@@ -90,34 +92,376 @@ def rule8(num):
     return dct_rule
 
 
-def compute_next(grd_current, rule):
+def get_rule_table(n_rule):
     """
-    Wolfram automaton iteration
-    :param grd_current:
-    :param rule:
-    :return:
+    Compile a Wolfram rule into an integer lookup table
+    :param n_rule: int rule number
+    :return: 1d numpy array of 8 uint8 next states indexed by 4 * left + 2 * center + right
+    """
+    return np.array([(n_rule >> k) & 1 for k in range(8)], dtype='uint8')
+
+
+def get_rule_table_kr(n_rule, n_colors=2, n_radius=1, totalistic=False):
+    """
+    Compile a 1d rule with k colors and radius r into an integer lookup table.
+    Digit d (base k) of the rule number is the next state of neighborhood code d,
+    where the code is the neighborhood read as a base-k number (leftmost cell most
+    significant) or, for totalistic rules, the sum of the neighborhood states.
+    :param n_rule: int rule number (Wolfram code)
+    :param n_colors: int number of cell states k
+    :param n_radius: int neighborhood radius r
+    :param totalistic: boolean for totalistic rules
+    :return: 1d numpy array of uint8 next states
+    """
+    n_window = 2 * n_radius + 1
+    if totalistic:
+        n_codes = n_window * (n_colors - 1) + 1
+    else:
+        n_codes = n_colors ** n_window
+    if n_rule < 0 or n_rule >= n_colors ** n_codes:
+        raise ValueError('rule {} is out of range for k={} r={}'.format(n_rule, n_colors, n_radius))
+    vct_table = np.zeros(n_codes, dtype='uint8')
+    n_rest = n_rule
+    for d in range(n_codes):
+        n_rest, vct_table[d] = divmod(n_rest, n_colors)
+    return vct_table
+
+
+def compute_next_kr(grd_current, rule, n_colors=2, n_radius=1, totalistic=False):
     """
-    grd_next = np.zeros(len(grd_current), dtype=int)
-    for i in range(len(grd_current)):
-        if i == 0:
-            bottom = len(grd_current) - 1
-            upper = i + 1
-        elif i == len(grd_current) - 1:
-            bottom = i - 1
-            upper = 0
+    Iteration of a 1d automaton with k colors and radius r (vectorized over the whole row)
+    :param grd_current: 1d numpy array current row
+    :param rule: 1d numpy array rule table, see get_rule_table_kr
+    :param n_colors: int number of cell states k
+    :param n_radius: int neighborhood radius r
+    :param totalistic: boolean for totalistic rules
+    :return: 1d numpy array next row
+    """
+    vct_code = np.zeros(len(grd_current), dtype='int64')
+    for d in range(-n_radius, n_radius + 1):
+        # cell i + d of the neighborhood, with wrap around
+        vct_cell = np.roll(grd_current, -d)
+        if totalistic:
+            vct_code += vct_cell
         else:
-            bottom = i - 1
-            upper = i + 1
-        lcl_pat = np.array([grd_current[bottom], grd_current[i], grd_current[upper]])
-        grd_next[i] = rule[str(lcl_pat)]
+            # Horner step of the base-k code
+            vct_code = vct_code * n_colors + vct_cell
+    return rule[vct_code]
+
+
+@jit
+def compute_next_jit(grd_current, vct_table):
+    """
+    Wolfram automaton iteration as a per-cell kernel, compiled when numba is installed
+    :param grd_current: 1d numpy array current row
+    :param vct_table: 1d numpy array rule table, see get_rule_table
+    :return: 1d numpy array next row
+    """
+    n_cells = len(grd_current)
+    grd_next = np.empty_like(grd_current)
+    for i in range(n_cells):
+        n_idx = 4 * grd_current[(i - 1) % n_cells] + 2 * grd_current[i] + grd_current[(i + 1) % n_cells]
+        grd_next[i] = vct_table[n_idx]
     return grd_next
 
 
-def play(vct_start, n_gens, n_rule=30):
+def warmup():
+    """
+    Compile the Wolfram kernels ahead of a timed run (no effect without numba)
+    :return: none
+    """
+    compute_next_jit(np.zeros(3, dtype='uint8'), get_rule_table(30))
+
+
+def compute_next(grd_current, rule):
+    """
+    Wolfram automaton iteration (vectorized over the whole row)
+    :param grd_current: 1d numpy array current row
+    :param rule: 1d numpy array rule table, see get_rule_table
+    :return: 1d numpy array next row
+    """
+    # neighborhood code 4 * left + 2 * center + right, with wrap around
+    vct_idx = 4 * np.roll(grd_current, 1) + 2 * grd_current + np.roll(grd_current, -1)
+    return rule[vct_idx]
+
+
+def compute_next_packed(vct_packed, n_cells, n_rule):
+    """
+    Wolfram automaton iteration on a bit-packed row (64 cells per uint64 word)
+    :param vct_packed: 1d numpy array of uint64 words, see backend.pack_bits
+    :param n_cells: int number of cells in the row
+    :param n_rule: int rule number
+    :return: 1d numpy array of uint64 words next row
+    """
+    vct_left = roll_bits(vct_packed, n_cells=n_cells, n_shift=1)
+    vct_right = roll_bits(vct_packed, n_cells=n_cells, n_shift=-1)
+    # boolean formula of the rule: OR of the neighborhoods that map to 1
+    vct_next = np.zeros_like(vct_packed)
+    for k in range(8):
+        if (n_rule >> k) & 1:
+            vct_next |= (vct_left if k & 4 else ~vct_left) \
+                        & (vct_packed if k & 2 else ~vct_packed) \
+                        & (vct_right if k & 1 else ~vct_right)
+    if n_cells % 64:
+        # keep the padding bits clear
+        vct_next[..., -1] &= np.uint64((1 << (n_cells % 64)) - 1)
+    return vct_next
+
+
+def compute_next_cone(grd_current, grd_next, rule, n_lo, n_width, n_background):
+    """
+    Wolfram automaton iteration restricted to the light cone of the active
+    interval: cells outside [n_lo, n_lo + n_width) hold the quiescent background,
+    so only the interval grown by one cell per side can change
+    :param grd_current: 1d numpy array current row
+    :param grd_next: 1d numpy array next row, already filled with the next background
+    :param rule: 1d numpy array rule table, see get_rule_table
+    :param n_lo: int first cell of the active interval (may wrap around)
+    :param n_width: int active interval width
+    :param n_background: int next background state
+    :return: int first cell and int width of the next active interval
+    """
+    n_cells = len(grd_current)
+    vct_ids = (n_lo - 1 + np.arange(n_width + 2)) % n_cells
+    vct_idx = 4 * grd_current[(vct_ids - 1) % n_cells] + 2 * grd_current[vct_ids] + grd_current[(vct_ids + 1) % n_cells]
+    vct_values = rule[vct_idx]
+    grd_next[vct_ids] = vct_values
+    # shrink the interval to the cells that differ from the background
+    vct_active = np.flatnonzero(vct_values != n_background)
+    if len(vct_active) == 0:
+        return n_lo, 0
+    return (n_lo - 1 + vct_active[0]) % n_cells, vct_active[-1] - vct_active[0] + 1
+
+
+def get_additive_shifts(n_rule):
+    """
+    Get the cell shifts of an additive rule, where the next state is the XOR
+    of some of left, center and right (eg. 90 = left XOR right, 150 = all three)
+    :param n_rule: int rule number
+    :return: list of np.roll shifts, or None if the rule is not additive
+    """
+    vct_table = get_rule_table(n_rule)
+    # coefficients of left, center and right
+    n_l, n_c, n_r = vct_table[4], vct_table[2], vct_table[1]
+    for k in range(8):
+        if vct_table[k] != (n_l * ((k >> 2) & 1)) ^ (n_c * ((k >> 1) & 1)) ^ (n_r * (k & 1)):
+            return None
+    lst_shifts = list()
+    if n_l:
+        lst_shifts.append(1)
+    if n_c:
+        lst_shifts.append(0)
+    if n_r:
+        lst_shifts.append(-1)
+    return lst_shifts
+
+
+def jump(vct_start, n_gens, n_rule=30):
+    """
+    Get the row of generation n_gens without keeping the history. Additive rules
+    jump ahead algebraically: the step operator is a sum of shifts over GF(2), so
+    its 2^j power is the same sum with shifts times 2^j, and the row is reached
+    in log2(n_gens) whole-row XORs. Other rules are stepped on packed words.
+    :param vct_start: 1d numpy array start row
+    :param n_gens: int number of generations to advance
+    :param n_rule: int rule number
+    :return: 1d numpy array row
+    """
+    n_cells = len(vct_start)
+    lst_shifts = get_additive_shifts(n_rule)
+    if lst_shifts is not None:
+        vct_row = np.asarray(vct_start) != 0
+        for j in range(int(n_gens).bit_length()):
+            if (n_gens >> j) & 1:
+                vct_next = np.zeros(n_cells, dtype=bool)
+                for n_shift in lst_shifts:
+                    vct_next ^= np.roll(vct_row, n_shift * (1 << j) % n_cells)
+                vct_row = vct_next
+        return vct_row.astype('uint8')
+    vct_packed = pack_bits(vct_start)
+    for i in range(n_gens):
+        vct_packed = compute_next_packed(vct_packed=vct_packed, n_cells=n_cells, n_rule=n_rule)
+    return unpack_bits(vct_packed, n_cells=n_cells)
+
+
+def play(vct_start, n_gens, n_rule=30, backend='numpy', engine='numpy',
+         n_colors=2, n_radius=1, totalistic=False):
+    """
+    Run the Wolfram automaton
+    :param vct_start: 1d numpy array start row
+    :param n_gens: int number of generations
+    :param n_rule: int rule number
+    :param backend: string 'numpy' or 'numba' to run the compiled per-cell kernel
+    (falls back to numpy if numba is not installed). The numba backend only runs
+    the byte-per-cell 'numpy' engine
+    :param engine: string 'numpy' (one byte per cell) or 'packed' (64 cells per
+    uint64 word, rows are unpacked into the output grid)
+    :param n_colors: int number of cell states k (general rules run the numpy
+    engine only)
+    :param n_radius: int neighborhood radius r
+    :param totalistic: boolean for totalistic rules
+    :return: 2d numpy array (generations x cells)
+    """
+    if engine not in ('numpy', 'packed'):
+        raise ValueError('unknown engine: {}'.format(engine))
+    if backend == 'numba' and engine != 'numpy':
+        raise ValueError('the numba backend only runs the numpy engine, got {}'.format(engine))
+    if n_colors != 2 or n_radius != 1 or totalistic:
+        if engine != 'numpy' or backend != 'numpy':
+            raise ValueError('k-color and radius-r rules run the numpy engine and backend only')
+        vct_table = get_rule_table_kr(n_rule, n_colors=n_colors, n_radius=n_radius, totalistic=totalistic)
+        grid = np.zeros(shape=(n_gens, len(vct_start)), dtype='uint8')
+        grid[0] = vct_start
+        for i in range(1, len(grid)):
+            grid[i] = compute_next_kr(grd_current=grid[i - 1],
+                                      rule=vct_table,
+                                      n_colors=n_colors,
+                                      n_radius=n_radius,
+                                      totalistic=totalistic)
+        return grid
     n_grid = len(vct_start)
-    dct_rule = rule8(n_rule)
+    b_jit = use_numba(backend)
+    vct_table = get_rule_table(n_rule)
     grid = np.zeros(shape=(n_gens, n_grid), dtype='uint8')
     grid[0] = vct_start
+    if engine == 'packed':
+        vct_packed = pack_bits(vct_start)
+    # light cone: active interval of cells that differ from the background
+    b_cone = engine == 'numpy' and not b_jit
+    n_background = 0
+    vct_active = np.flatnonzero(grid[0])
+    n_lo = vct_active[0] if len(vct_active) else 0
+    n_width = vct_active[-1] - vct_active[0] + 1 if len(vct_active) else 0
     for i in range(1, len(grid)):
-        grid[i] = compute_next(grd_current=grid[i - 1], rule=dct_rule)
+        if b_cone and n_width + 2 < n_grid:
+            # an all-0 or all-1 neighborhood maps the background
+            n_background = vct_table[7 * n_background]
+            if n_background:
+                grid[i].fill(1)
+            if n_width > 0:
+                n_lo, n_width = compute_next_cone(grd_current=grid[i - 1],
+                                                  grd_next=grid[i],
+                                                  rule=vct_table,
+                                                  n_lo=n_lo,
+                                                  n_width=n_width,
+                                                  n_background=n_background)
+        elif engine == 'packed':
+            vct_packed = compute_next_packed(vct_packed=vct_packed, n_cells=n_grid, n_rule=n_rule)
+            grid[i] = unpack_bits(vct_packed, n_cells=n_grid)
+        elif b_jit:
+            grid[i] = compute_next_jit(grd_current=grid[i - 1], vct_table=vct_table)
+        else:
+            grid[i] = compute_next(grd_current=grid[i - 1], rule=vct_table)
     return grid
+
+
+def stream(vct_start, n_gens, n_rule=30, n_window=None):
+    """
+    Generator of the Wolfram automaton rows, computed on demand so that memory
+    does not grow with n_gens
+    :param vct_start: 1d numpy array start row
+    :param n_gens: int number of generations (including the start row)
+    :param n_rule: int rule number
+    :param n_window: int to yield sliding windows of the last n_window rows
+    instead of single rows (the first window ends at row n_window - 1)
+    :return: generator of 1d numpy array rows or 2d numpy array windows. Windows
+    are views of a ring buffer that are overwritten on the next step; copy them to keep them
+    """
+    vct_table = get_rule_table(n_rule)
+    vct_row = np.array(vct_start, dtype='uint8')
+    if n_window is not None:
+        # ring buffer holding every row twice, so that the last n_window rows
+        # are always one contiguous slice
+        grd_ring = np.zeros(shape=(2 * n_window, len(vct_row)), dtype='uint8')
+    for i in range(n_gens):
+        if i > 0:
+            vct_row = compute_next(grd_current=vct_row, rule=vct_table)
+        if n_window is None:
+            yield vct_row
+        else:
+            n_slot = i % n_window
+            grd_ring[n_slot] = vct_row
+            grd_ring[n_slot + n_window] = vct_row
+            if i >= n_window - 1:
+                yield grd_ring[n_slot + 1: n_slot + 1 + n_window]
+
+
+def get_block_entropy(grd, n_block=3):
+    """
+    Shannon entropy of the (cyclic) n-cell block distribution of each row
+    :param grd: 2d numpy array of rows
+    :param n_block: int block length
+    :return: 1d numpy array entropy in bits per row (0 to n_block)
+    """
+    grd_codes = np.zeros(shape=np.shape(grd), dtype='int64')
+    for k in range(n_block):
+        grd_codes = 2 * grd_codes + np.roll(grd, -k, axis=1)
+    vct_entropy = np.zeros(len(grd))
+    for i in range(len(grd)):
+        vct_p = np.bincount(grd_codes[i], minlength=2 ** n_block) / len(grd_codes[i])
+        vct_p = vct_p[vct_p > 0]
+        vct_entropy[i] = np.sum(vct_p * np.log2(1 / vct_p))
+    return vct_entropy
+
+
+def sweep(vct_start, n_gens, lst_rules=None, trace=False, n_history=1000):
+    """
+    Run many rules at once: the rows of all rules are stacked in one
+    (rules x cells) array and stepped with a per-rule table gather
+    :param vct_start: 1d numpy array start row (same for all rules)
+    :param n_gens: int number of generations
+    :param lst_rules: list of int rule numbers (default: all 256 rules)
+    :param trace: boolean to keep the full evolution (generations x rules x cells)
+    :param n_history: int number of most recent row hashes kept per rule for cycle
+    detection, so memory stays bounded for rules that never cycle. Cycles with a
+    period longer than this are not detected
+    :return: output dict, with Summary as a pandas dataframe of per-rule
+    Density (end row), Mean_Density (all generations), Entropy (3-cell block
+    entropy of the end row, bits), Transient and Period (0 when no cycle is found)
+    """
+    import hashlib
+    if lst_rules is None:
+        lst_rules = list(range(256))
+    n_rules = len(lst_rules)
+    n_cells = len(vct_start)
+    # the 8-bit rule number is its own table: bit k is the next state of code k
+    vct_tables = np.array(lst_rules, dtype='uint8')[:, None]
+    grd = np.zeros(shape=(n_rules, n_cells), dtype='uint8')
+    grd[:] = vct_start
+    if trace:
+        grd3_traced = np.zeros(shape=(n_gens, n_rules, n_cells), dtype='uint8')
+    vct_density_sum = np.zeros(n_rules)
+    # cycle detection per rule: row hash -> generation
+    lst_history = [dict() for r in range(n_rules)]
+    vct_transient = np.zeros(n_rules, dtype='int64')
+    vct_period = np.zeros(n_rules, dtype='int64')
+    for i in range(n_gens):
+        if i > 0:
+            # compute next for all rules
+            grd_idx = 4 * np.roll(grd, 1, axis=1) + 2 * grd + np.roll(grd, -1, axis=1)
+            grd = (vct_tables >> grd_idx) & 1
+        if trace:
+            grd3_traced[i] = grd
+        vct_density_sum += np.mean(grd, axis=1)
+        for r in np.flatnonzero(vct_period == 0):
+            s_key = hashlib.blake2b(grd[r].tobytes(), digest_size=16).digest()
+            if s_key in lst_history[r]:
+                vct_transient[r] = lst_history[r][s_key]
+                vct_period[r] = i - vct_transient[r]
+                lst_history[r] = None
+            else:
+                lst_history[r][s_key] = i
+                if len(lst_history[r]) > n_history:
+                    # drop the oldest generation
+                    del lst_history[r][next(iter(lst_history[r]))]
+    df_summary = pd.DataFrame({'Rule': lst_rules,
+                               'Density': np.mean(grd, axis=1),
+                               'Mean_Density': vct_density_sum / max(n_gens, 1),
+                               'Entropy': get_block_entropy(grd),
+                               'Transient': vct_transient,
+                               'Period': vct_period})
+    # output
+    dct_out = {'Summary': df_summary, 'End': grd}
+    if trace:
+        dct_out['Evolution'] = grd3_traced
+    return dct_out